@@ -0,0 +1,32 @@
+#!/bin/bash
+
+# Measures the cost of an idle run of MonVerifyTool.py (no new files in dropbox,
+# missing files check already done today), with and without the fast exit path.
+#
+# Syntax:
+#
+# > bench_startup.sh [<number of runs>]
+
+RUNS=${1:-20}
+SCRIPTDIR=$(cd "$(dirname "$0")/../scripts" && pwd)
+PROJECT=$(mktemp -d)
+
+# idle project with the configuration of the test project
+mkdir -p "$PROJECT"/{dropbox,config,log,review,archive,bypass,status}
+cp "$(dirname "$0")"/testProject/config/* "$PROJECT/config/"
+
+# first run performs the missing files check and writes the stamp file
+python3 "$SCRIPTDIR/MonVerifyTool.py" "$PROJECT" > /dev/null
+
+echo "Idle run, fast exit ($RUNS runs):"
+time (for i in $(seq $RUNS); do python3 "$SCRIPTDIR/MonVerifyTool.py" "$PROJECT" > /dev/null; done)
+
+echo
+echo "Idle run, --full-run ($RUNS runs):"
+time (for i in $(seq $RUNS); do python3 "$SCRIPTDIR/MonVerifyTool.py" --full-run "$PROJECT" > /dev/null; done)
+
+echo
+echo "Interpreter start-up only ($RUNS runs):"
+time (for i in $(seq $RUNS); do python3 -c "pass"; done)
+
+rm -rf "$PROJECT"
@@ -8,5 +8,7 @@ rm -rf review/TestHaus
 rm log/errors_*
 rm log/processed
 rm log/missing
+rm -rf status
+rm -rf stats
 
 git checkout -- dropbox/Fehlertests
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class AcceptedMissing, holding the files accepted as missing (file 'archive/missing.accepted').
+
+Each line of the file holds one entry, followed by an optional comment. An entry is either
+
+- a single file name, for example 'Fehlertests/Test_2016-03-05_00-00-00.csv', or
+- a prefix glob pattern followed by a date range 'YYYY-MM-DD..YYYY-MM-DD' (both days inclusive),
+  for example 'Fehlertests/Test_* 2016-03-01..2016-05-31 logger outage'. Start or end of the range
+  may be omitted for an open range, a single date accepts just this day.
+
+The glob pattern is matched against the expected file prefixes (see fnmatch module), so that
+'Fehlertests/*' accepts missing files of all prefixes in directory 'Fehlertests'. For each expected
+file prefix the date ranges of all matching entries are merged into a sorted list of disjoint
+intervals, and a day is looked up by bisection.
+"""
+
+import bisect
+import fnmatch
+import os
+import re
+from datetime import datetime
+
+
+# date range 'YYYY-MM-DD..YYYY-MM-DD', 'YYYY-MM-DD..', '..YYYY-MM-DD' or 'YYYY-MM-DD'
+DATE_RANGE_REGEX = re.compile(r'^(\d{4}-\d{2}-\d{2})?(\.\.)?(\d{4}-\d{2}-\d{2})?$')
+FIRST_DAY = '0000-00-00'
+LAST_DAY = '9999-99-99'
+
+
+def parseDateRange(rangeString):
+	"""Parses a date range string.
+
+	Returns tuple (first day, last day) as 'YYYY-MM-DD' strings, or None if the string is not a valid date range.
+	"""
+	m = DATE_RANGE_REGEX.match(rangeString)
+	if m == None or (m.group(1) == None and m.group(3) == None):
+		return None
+	if m.group(2) == None:
+		if m.group(3) != None:
+			return None # 'YYYY-MM-DDYYYY-MM-DD'
+		first = last = m.group(1)
+	else:
+		first = m.group(1) if m.group(1) != None else FIRST_DAY
+		last = m.group(3) if m.group(3) != None else LAST_DAY
+	try:
+		for day in (first, last):
+			if day not in (FIRST_DAY, LAST_DAY):
+				datetime.strptime(day, '%Y-%m-%d')
+	except ValueError:
+		return None
+	if first > last:
+		return None
+	return (first, last)
+
+
+class AcceptedMissing:
+	"""Files accepted as missing, read from one or more missing.accepted files.
+
+	Entries are kept in a dictionary with the entry (file name, or pattern and date range) as key
+	and the comment as value. Later entries with the same key replace the comment of earlier ones.
+	"""
+	def __init__(self):
+		self.entries = dict() # key = entry string, value = comment
+		self.files = set() # entries with single file names
+		self.ranges = [] # list of tuples (prefix pattern, first day, last day)
+		self.intervalIndex = dict() # cached interval index, key = expected file prefix
+		self.modified = False
+
+	def read(self, filePath):
+		"""Reads entries from a missing.accepted file (if existing) and adds them to the list.
+
+		Returns True, if the file existed.
+		"""
+		if not os.path.exists(filePath):
+			return False
+		with open(filePath, 'r') as fobj:
+			for l in fobj:
+				tokens = l.split(None, 2)
+				if len(tokens) == 0:
+					continue
+				dateRange = None
+				# single file names may be followed by a comment starting with a date
+				if len(tokens) > 1 and not tokens[0].lower().endswith('.csv'):
+					dateRange = parseDateRange(tokens[1])
+				if dateRange != None:
+					key = tokens[0] + ' ' + tokens[1]
+					comment = tokens[2].strip() if len(tokens) > 2 else ''
+				else:
+					key = tokens[0]
+					comment = ' '.join(tokens[1:]).strip()
+				if self.entries.get(key) == comment:
+					continue
+				if key not in self.entries:
+					if dateRange != None:
+						self.ranges.append( (tokens[0], dateRange[0], dateRange[1]) )
+					else:
+						self.files.add(key)
+				self.entries[key] = comment
+				self.modified = True
+		self.intervalIndex = dict()
+		return True
+
+	def write(self, filePath):
+		"""Writes all entries sorted to a missing.accepted file."""
+		with open(filePath + '.tmp', 'w') as fobj:
+			for k in sorted(self.entries):
+				fobj.write("{} {}".format(k, self.entries[k]).strip() + "\n")
+		os.rename(filePath + '.tmp', filePath)
+		self.modified = False
+
+	def intervalsForPrefix(self, prefix):
+		"""Returns the interval index for an expected file prefix, i.e. tuple (list of first days,
+		list of last days) of the merged, sorted and disjoint date ranges of all matching entries.
+		"""
+		index = self.intervalIndex.get(prefix)
+		if index != None:
+			return index
+		intervals = sorted([(first, last) for pattern, first, last in self.ranges if fnmatch.fnmatchcase(prefix, pattern)])
+		firstDays = []
+		lastDays = []
+		for first, last in intervals:
+			if len(lastDays) != 0 and first <= lastDays[-1]:
+				lastDays[-1] = max(lastDays[-1], last) # overlapping ranges
+			else:
+				firstDays.append(first)
+				lastDays.append(last)
+		index = (firstDays, lastDays)
+		self.intervalIndex[prefix] = index
+		return index
+
+	def isAccepted(self, prefix, dayString, fileName):
+		"""Tests if a file is accepted as missing.
+
+		Arguments
+		---------
+		prefix
+		    Expected file prefix
+		dayString
+		    Day in format 'YYYY-MM-DD'
+		fileName
+		    Full file name (prefix, day and suffix), as listed for single file entries
+
+		Returns True, if the file is accepted as missing.
+		"""
+		if fileName in self.files:
+			return True
+		firstDays, lastDays = self.intervalsForPrefix(prefix)
+		i = bisect.bisect_right(firstDays, dayString) - 1
+		return i >= 0 and dayString <= lastDays[i]
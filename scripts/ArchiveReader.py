@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Functions for reading archived data files (plain or compressed).
+
+Files in the block-based gzip format (see Compression.py) are read with random access, i.e.
+only the blocks holding the requested time range (or the last sample) are decompressed.
+Other files are read sequentially.
+"""
+
+import io
+import locale
+import os
+
+from Compression import COMPRESSION_SUFFIXES, openText, readBlockIndex, readBlock
+
+# length of time stamp 'YYYY-MM-DD HH:MM:SS' at begin of data lines
+TIME_STAMP_LENGTH = 19
+
+# size of the end part of uncompressed files read to find the last data line
+TAIL_SIZE = 64*1024
+
+
+def findArchivedFile(archiveDir, prefix, dayString):
+	"""Looks for the archived file of a prefix and day.
+
+	Arguments
+	---------
+	archiveDir
+	    Archive directory
+	prefix
+	    Expected file prefix (path relative to archive dir, e.g. 'Fehlertests/Test_')
+	dayString
+	    Day in format 'YYYY-MM-DD'
+
+	Returns tuple (full file path, compression suffix), or None if the file does not exist.
+	"""
+	filePath = archiveDir + '/' + prefix + dayString + '_00-00-00.csv'
+	for suffix in [''] + COMPRESSION_SUFFIXES:
+		if os.path.exists(filePath + suffix):
+			return (filePath + suffix, suffix)
+	return None
+
+
+def _blockLines(f, block):
+	"""Returns the lines of a block (without line endings)."""
+	with io.TextIOWrapper(io.BytesIO(readBlock(f, block))) as text:
+		return [l.strip('\r\n') for l in text]
+
+
+def readHeader(filePath, suffix):
+	"""Returns the header lines (without the empty line ending the header section) of a data file."""
+	blocks = readBlockIndex(filePath) if suffix == '.gz' else None
+	if blocks != None:
+		with open(filePath, 'rb') as f:
+			lines = _blockLines(f, blocks[0])
+		return [l for l in lines if l != '']
+	header = []
+	with openText(filePath, suffix) as f:
+		for line in f:
+			line = line.strip('\r\n')
+			if line == '':
+				break
+			header.append(line)
+	return header
+
+
+def readTimeRange(filePath, suffix, start=None, end=None):
+	"""Generator that yields the data lines (without line endings) of a data file within a time range.
+
+	The time range is given by the time stamp strings start (inclusive) and end (exclusive) in
+	format 'YYYY-MM-DD HH:MM:SS', None means open range. Data lines are expected to be sorted
+	by time stamp (as ensured by the checks for archived files).
+	"""
+	blocks = readBlockIndex(filePath) if suffix == '.gz' else None
+	if blocks != None:
+		with open(filePath, 'rb') as f:
+			dataBlocks = blocks[1:]
+			for i in range(len(dataBlocks)):
+				# block covers time stamps from its first line up to the first line of the next block
+				if end != None and dataBlocks[i][3] >= end:
+					break
+				if start != None and i+1 < len(dataBlocks) and dataBlocks[i+1][3] < start:
+					continue
+				for line in _blockLines(f, dataBlocks[i]):
+					ts = line[:TIME_STAMP_LENGTH]
+					if (start == None or ts >= start) and (end == None or ts < end):
+						yield line
+		return
+
+	with openText(filePath, suffix) as f:
+		lines = (l.strip('\r\n') for l in f)
+		for line in lines:
+			if line == '':
+				break # end of header section
+		for line in lines:
+			ts = line[:TIME_STAMP_LENGTH]
+			if end != None and ts >= end:
+				break
+			if start == None or ts >= start:
+				yield line
+
+
+def readLastDataLine(filePath, suffix):
+	"""Returns the last data line of a data file, or None if the file has no data lines."""
+	blocks = readBlockIndex(filePath) if suffix == '.gz' else None
+	if blocks != None:
+		if len(blocks) < 2:
+			return None
+		with open(filePath, 'rb') as f:
+			lines = [l for l in _blockLines(f, blocks[-1]) if l != '']
+		return lines[-1] if len(lines) != 0 else None
+
+	if suffix == '' and os.path.getsize(filePath) > TAIL_SIZE:
+		# uncompressed files: only the end of the file is read, unless it contains the end of the header section
+		with open(filePath, 'rb') as f:
+			f.seek(-TAIL_SIZE, os.SEEK_END)
+			lines = [l.strip(b'\r') for l in f.read().split(b'\n')[1:]] # first line may be incomplete
+		if len(lines) != 0 and lines[-1] == b'':
+			lines.pop() # line break at end of file
+		if len(lines) != 0 and b'' not in lines:
+			return lines[-1].decode(locale.getpreferredencoding(False))
+
+	lastLine = None
+	with openText(filePath, suffix) as f:
+		lines = (l.strip('\r\n') for l in f)
+		for line in lines:
+			if line == '':
+				break # end of header section
+		for line in lines:
+			if line != '':
+				lastLine = line
+	return lastLine
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Classes for scrubbing the archive, i.e. the incremental re-verification of archived files against
+the checksums stored in the fingerprint index and against the current checks.
+
+Each run scrubs a slice of the archive (files in path order, continuing after the last file scrubbed
+in the previous run), so that a full pass over the archive is spread over many runs. The read rate
+is limited, so that scrubbing does not compete with the processing of new files.
+"""
+
+import bisect
+import json
+import os
+import time
+
+from FingerprintIndex import fileFingerprint
+from print_funcs import *
+
+
+class IoThrottle:
+	"""Limits the average read rate by sleeping, if more bytes were read than allowed by the bandwidth."""
+	def __init__(self, bytesPerSecond):
+		self.bytesPerSecond = bytesPerSecond # 0 = no limit
+		self.startTime = time.time()
+		self.bytesRead = 0
+		self.sleepTime = 0 # total time spent sleeping, in seconds
+
+	def consume(self, byteCount):
+		"""Accounts for byteCount bytes read, sleeps if the read rate exceeds the limit."""
+		self.bytesRead = self.bytesRead + byteCount
+		if self.bytesPerSecond <= 0:
+			return
+		delay = self.startTime + self.bytesRead/self.bytesPerSecond - time.time()
+		if delay > 0:
+			time.sleep(delay)
+			self.sleepTime = self.sleepTime + delay
+
+
+def throttledFingerprint(filePath, throttle):
+	"""Computes the content fingerprint of a file (same as fileFingerprint()), with limited read rate.
+	For compressed files, the uncompressed bytes count against the read rate.
+	"""
+	return fileFingerprint(filePath, readCallback=throttle.consume)
+
+
+class ScrubState:
+	"""Persistent progress of the archive scrubbing, kept in a json file (usually 'status/scrubstate').
+
+	Holds the path of the last scrubbed file (files are scrubbed in path order), the start time of the
+	current pass, the number of completed passes and the end time of the last completed pass.
+	"""
+	def __init__(self, stateFilePath):
+		self.stateFilePath = stateFilePath
+		self.lastPath = '' # path (relative to archive dir) of last scrubbed file, '' = start of pass
+		self.passStart = None # time stamp string of start of current pass
+		self.passCount = 0
+		self.lastPassEnd = None # time stamp string of end of last completed pass
+		self.passFileCount = 0 # files scrubbed in current pass
+		self.passFailedCount = 0 # files failed in current pass
+
+	def read(self):
+		"""Reads state file, if existing. A corrupt state file is ignored (with warning), i.e. a new pass is started."""
+		if not os.path.exists(self.stateFilePath):
+			return
+		try:
+			with open(self.stateFilePath, 'r') as f:
+				data = json.load(f)
+			self.lastPath = data['lastPath']
+			self.passStart = data['passStart']
+			self.passCount = data['passCount']
+			self.lastPassEnd = data['lastPassEnd']
+			self.passFileCount = data['passFileCount']
+			self.passFailedCount = data['passFailedCount']
+		except (ValueError, KeyError, TypeError, IOError) as e:
+			printWarning("Cannot read scrub state file '{}', starting new scrub pass.".format(self.stateFilePath))
+			self.__init__(self.stateFilePath)
+
+	def write(self):
+		"""Writes state file."""
+		data = {'lastPath' : self.lastPath, 'passStart' : self.passStart, 'passCount' : self.passCount,
+		        'lastPassEnd' : self.lastPassEnd, 'passFileCount' : self.passFileCount,
+		        'passFailedCount' : self.passFailedCount}
+		with open(self.stateFilePath + ".tmp", 'w') as f:
+			json.dump(data, f, sort_keys=True)
+		os.rename(self.stateFilePath + ".tmp", self.stateFilePath)
+
+	def nextSlice(self, paths, count):
+		"""Returns the next files to scrub.
+
+		Arguments
+		---------
+		paths
+		    Sorted list of paths (relative to archive dir) of all archived files
+		count
+		    Max. number of files to return
+
+		Returns list of paths following the last scrubbed file. At the end of the archive, the list
+		is not continued with the first files (the next pass starts in the next run).
+		"""
+		i = bisect.bisect_right(paths, self.lastPath)
+		return paths[i:i + count]
+
+	def fileScrubbed(self, relPath, passed, timeStamp):
+		"""Records a scrubbed file."""
+		if self.lastPath == '' or self.passStart == None:
+			self.passStart = timeStamp
+		self.lastPath = relPath
+		self.passFileCount = self.passFileCount + 1
+		if not passed:
+			self.passFailedCount = self.passFailedCount + 1
+
+	def passCompleted(self, timeStamp):
+		"""Ends the current pass, the next file scrubbed starts a new pass."""
+		self.passCount = self.passCount + 1
+		self.lastPassEnd = timeStamp
+		self.lastPath = ''
+		self.passStart = None
+		self.passFileCount = 0
+		self.passFailedCount = 0
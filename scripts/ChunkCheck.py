@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Parallel check of the data section of a single large file.
+
+The data section is split into byte ranges (chunks) aligned at line starts. Each chunk is checked
+by the test group's checkDataSection() in a worker process, with errors being recorded instead of
+reported. The chunk results are then merged in file order: the sampling interval between the last
+sample of a chunk and the first sample of the next chunk is checked (stitching), and the recorded
+errors are reported. Hence the reported errors are the same as for a sequential check.
+
+Worker processes are created with 'fork', so that the script is not re-imported in the workers.
+On platforms without 'fork' the files are checked sequentially.
+
+For the incremental re-check of corrected files, the data section is split into content-defined
+blocks instead, and the block results are kept in a manifest file (see checkDataSectionIncrementally()).
+"""
+
+import hashlib
+import itertools
+import locale
+import multiprocessing
+import os
+import pickle
+import zlib
+from datetime import datetime
+
+from SensorStats import SensorStats
+from TestGroups import TEST_GROUPS, TIME_STAMP_FORMAT
+
+# error categories of data lines that are skipped in the interval check
+INVALID_LINE_ERRORS = ('ColumnCountMismatch', 'InvalidTimeStamp')
+
+# content-defined blocks: min./max. block size in bytes and mask of the line hash bits that must be zero
+# at a block boundary (about 1 of 4096 lines, i.e. blocks of about 1 MB for typical data lines)
+BLOCK_MIN_SIZE = 256*1024
+BLOCK_MAX_SIZE = 4*1024*1024
+BLOCK_BOUNDARY_MASK = 0xfff
+
+
+def createPool(workers):
+	"""Creates a process pool for chunk checks. Returns None, if worker processes cannot be forked."""
+	if 'fork' not in multiprocessing.get_all_start_methods():
+		return None
+	return multiprocessing.get_context('fork').Pool(workers)
+
+
+def dataSectionOffset(filePath):
+	"""Returns the byte offset of the first data line (after the empty line ending the header section),
+	or None if the file has no data section.
+	"""
+	with open(filePath, 'rb') as f:
+		for line in f:
+			if line.strip(b'\r\n') == b'':
+				return f.tell()
+	return None
+
+
+def splitDataSection(filePath, dataOffset, fileSize, chunkCount):
+	"""Splits the data section into byte ranges of about equal size, each starting at a line start.
+
+	Returns list of tuples (start offset, end offset).
+	"""
+	bounds = [dataOffset]
+	with open(filePath, 'rb') as f:
+		for i in range(1, chunkCount):
+			pos = dataOffset + (fileSize - dataOffset)*i//chunkCount
+			if pos <= bounds[-1]:
+				continue
+			# move to start of next line
+			f.seek(pos - 1)
+			f.readline()
+			pos = f.tell()
+			if pos > bounds[-1] and pos < fileSize:
+				bounds.append(pos)
+	bounds.append(fileSize)
+	return list(zip(bounds[:-1], bounds[1:]))
+
+
+class ChunkResult:
+	"""Result of the check of one chunk, merged with the results of the other chunks in checkDataSectionInChunks()."""
+	def __init__(self):
+		self.sampleCount = 0
+		self.errors = [] # list of tuples (category, message), in order of occurrence
+		self.suppressed = dict() # number of errors not recorded (beyond per-category limit), key = category
+		self.firstTimeStamp = None # tuple (time stamp, time stamp string) of first line of chunk, if valid
+		self.lastSample = None # tuple (time stamp, values) of last line of chunk, if valid
+		self.invalidLines = False # True, if chunk contains lines skipped in the interval check
+		self.stats = None
+		self.stopped = False # True, if check of chunk was stopped due to an error (fail-fast mode)
+
+
+class ChunkCheck:
+	"""Replaces FileCheck in worker processes, errors are recorded in the ChunkResult."""
+	def __init__(self, fname, ef, sensorTokens, maxErrorsPerCategory, result):
+		self.fname = fname
+		self.ef = ef
+		self.sensorTokens = sensorTokens
+		self.prevSample = None # interval to previous chunk is checked when merging
+		self.sampleCount = 0
+		self.lastSample = None
+		self.stats = None
+		self.maxErrorsPerCategory = maxErrorsPerCategory
+		self.errorCounts = dict()
+		self.result = result
+
+	def error(self, category, message):
+		"""Records an error. Returns True, if checking of the chunk shall stop."""
+		count = self.errorCounts.get(category, 0) + 1
+		self.errorCounts[category] = count
+		if self.maxErrorsPerCategory == 0 or count <= self.maxErrorsPerCategory:
+			self.result.errors.append( (category, message) )
+		else:
+			self.result.suppressed[category] = self.result.suppressed.get(category, 0) + 1
+		if category in INVALID_LINE_ERRORS:
+			self.result.invalidLines = True
+		return self.maxErrorsPerCategory == 0
+
+
+def chunkLines(f, end):
+	"""Generator that yields the lines (without line endings) of a file opened in binary mode up to byte offset end."""
+	encoding = locale.getpreferredencoding(False) # same encoding as used for files opened in text mode
+	pos = f.tell()
+	while pos < end:
+		line = f.readline()
+		if not line:
+			break
+		pos = pos + len(line)
+		yield line.decode(encoding).strip('\r\n')
+
+
+def checkChunk(task):
+	"""Checks one chunk of the data section, executed in a worker process.
+
+	Arguments
+	---------
+	task
+	    Tuple (test group name, file path, start offset, end offset, file name, expected file definition,
+	    SensorID tokens, collect statistics flag, max. errors per category)
+
+	Returns ChunkResult object.
+	"""
+	groupName, filePath, start, end, fname, ef, sensorTokens, collectStats, maxErrorsPerCategory = task
+	group = TEST_GROUPS[groupName]
+	result = ChunkResult()
+	check = ChunkCheck(fname, ef, sensorTokens, maxErrorsPerCategory, result)
+	if collectStats:
+		check.stats = SensorStats(sensorTokens)
+	with open(filePath, 'rb') as f:
+		f.seek(start)
+		lines = chunkLines(f, end)
+		firstLine = next(lines, None)
+		if firstLine == None:
+			return result
+		# the first line is needed to check the interval to the last sample of the previous chunk
+		tokens = firstLine.split(',')
+		if len(tokens) == len(sensorTokens):
+			try:
+				result.firstTimeStamp = (datetime.strptime(tokens[0], TIME_STAMP_FORMAT), tokens[0])
+			except ValueError:
+				pass
+		result.stopped = not group.checkDataSection(check, itertools.chain([firstLine], lines))
+	result.sampleCount = check.sampleCount
+	result.lastSample = check.lastSample
+	result.stats = check.stats
+	return result
+
+
+def checkDataSectionInChunks(check, group, filePath, dataOffset, fileSize, pool, chunkCount, maxErrorsPerCategory):
+	"""Checks the data section of a file in parallel chunks, replaces group.checkDataSection(check, lines).
+
+	Arguments
+	---------
+	check
+	    FileCheck object of the file, receives sample count, last sample and sensor statistics
+	group
+	    TestGroup object
+	filePath
+	    Full path to the (uncompressed) data file
+	dataOffset
+	    Byte offset of the first data line
+	fileSize
+	    File size in bytes
+	pool
+	    Process pool, as created by createPool()
+	chunkCount
+	    Number of chunks to split the data section into
+	maxErrorsPerCategory
+	    Number of errors reported per category (0 = stop at first error)
+
+	Returns False, if checking of the file shall stop due to an error.
+	"""
+	tasks = [(group.name, filePath, start, end, check.fname, check.ef, check.sensorTokens, check.stats != None, maxErrorsPerCategory)
+	         for start, end in splitDataSection(filePath, dataOffset, fileSize, chunkCount)]
+	# results are returned in chunk order
+	return mergeChunkResults(check, group, pool.imap(checkChunk, tasks))
+
+
+def mergeChunkResults(check, group, results):
+	"""Merges the results of the chunks of a data section (in file order): checks the sampling intervals
+	between the chunks and reports the recorded errors.
+
+	Arguments
+	---------
+	check
+	    FileCheck object of the file, receives sample count, last sample and sensor statistics
+	group
+	    TestGroup object
+	results
+	    Iterable of ChunkResult objects, in file order
+
+	Returns False, if checking of the file shall stop due to an error.
+	"""
+	ef = check.ef
+	minIntervalLength = ef.intervalMin
+	maxIntervalLength = ef.intervalMax
+	prevSample = check.prevSample
+	lastTimeStamp = None
+	sampleCount = 0
+	lastSample = None
+	for result in results:
+		if result.sampleCount == 0 and not result.stopped:
+			continue # empty chunk
+		# stitch chunks: interval between last sample of previous chunk (or previous file) and first line of chunk
+		if result.firstTimeStamp != None:
+			ts, tsString = result.firstTimeStamp
+			if lastTimeStamp == None and prevSample != None and prevSample[0] < ts:
+				msg = group.checkPreviousFileInterval(ef, prevSample[0], ts, tsString)
+				if msg != None and check.error('InvalidSamplingInterval', msg):
+					return False
+			if lastTimeStamp != None and ef.interval > 0:
+				timeDiffSec = (ts-lastTimeStamp).total_seconds()
+				if timeDiffSec < minIntervalLength or timeDiffSec > maxIntervalLength:
+					if check.error('InvalidSamplingInterval', group.intervalErrorMessage(ef, timeDiffSec, tsString)):
+						return False
+		# report errors of chunk
+		for category, message in result.errors:
+			if check.error(category, message):
+				return False
+		for category in result.suppressed:
+			check.countSuppressedErrors(category, result.suppressed[category])
+		if result.stopped:
+			return False
+		sampleCount = sampleCount + result.sampleCount
+		if result.invalidLines:
+			prevSample = None
+		lastSample = result.lastSample
+		lastTimeStamp = lastSample[0] if lastSample != None else None
+		if check.stats != None:
+			check.stats.merge(result.stats)
+
+	check.sampleCount = sampleCount
+	check.lastSample = lastSample
+	return True
+
+
+def contentDefinedBlocks(filePath, dataOffset, fileSize):
+	"""Splits the data section into blocks of complete lines with boundaries defined by the content: a block
+	ends after a line whose hash matches BLOCK_BOUNDARY_MASK (or when the max. block size is reached).
+	Hence, modifying a line only changes the checksum of its block (and, if lines are inserted or removed,
+	of the following block), while the other blocks keep their boundaries and checksums.
+
+	Returns list of tuples (start offset, end offset, checksum).
+	"""
+	blocks = []
+	with open(filePath, 'rb') as f:
+		f.seek(dataOffset)
+		start = dataOffset
+		pos = dataOffset
+		h = hashlib.blake2b(digest_size=16)
+		for line in f:
+			h.update(line)
+			pos = pos + len(line)
+			size = pos - start
+			if size >= BLOCK_MIN_SIZE and (zlib.crc32(line) & BLOCK_BOUNDARY_MASK == 0 or size >= BLOCK_MAX_SIZE):
+				blocks.append( (start, pos, h.hexdigest()) )
+				start = pos
+				h = hashlib.blake2b(digest_size=16)
+		if pos > start:
+			blocks.append( (start, pos, h.hexdigest()) )
+	return blocks
+
+
+def checkDataSectionIncrementally(check, group, filePath, dataOffset, fileSize, pool, maxErrorsPerCategory, manifestPath):
+	"""Checks the data section of a file in content-defined blocks, replaces group.checkDataSection(check, lines).
+
+	The checksums and check results of all blocks are stored in a manifest file. When the file is checked
+	again (e.g. after it was corrected in the review directory), only the blocks with changed checksums
+	are checked, the results of unchanged blocks are taken from the manifest. The intervals between
+	the blocks are always checked when merging the block results.
+
+	Arguments
+	---------
+	check
+	    FileCheck object of the file, receives sample count, last sample and sensor statistics
+	group
+	    TestGroup object
+	filePath
+	    Full path to the (uncompressed) data file
+	dataOffset
+	    Byte offset of the first data line
+	fileSize
+	    File size in bytes
+	pool
+	    Process pool, as created by createPool(), or None to check the blocks sequentially
+	maxErrorsPerCategory
+	    Number of errors reported per category (0 = stop at first error)
+	manifestPath
+	    Path of the manifest file of the data file
+
+	Returns tuple (False if checking of the file shall stop due to an error, bytes of reused blocks).
+	"""
+	blocks = contentDefinedBlocks(filePath, dataOffset, fileSize)
+	# results are only valid for the same check settings
+	checkKey = repr( (group.name, [getattr(check.ef, s) for s in check.ef.__slots__], check.sensorTokens,
+	                  check.stats != None, maxErrorsPerCategory) )
+	storedResults = readManifest(manifestPath, checkKey)
+	tasks = [(group.name, filePath, start, end, check.fname, check.ef, check.sensorTokens, check.stats != None, maxErrorsPerCategory)
+	         for start, end, checksum in blocks if checksum not in storedResults]
+	newResults = pool.imap(checkChunk, tasks) if pool != None else map(checkChunk, tasks)
+	# all changed blocks are checked (even after an error), so that the manifest is complete
+	results = dict() # key = checksum, value = ChunkResult
+	reusedBytes = 0
+	for start, end, checksum in blocks:
+		if checksum in storedResults:
+			results[checksum] = storedResults[checksum]
+			reusedBytes = reusedBytes + end - start
+		elif checksum not in results:
+			results[checksum] = next(newResults)
+		else:
+			next(newResults) # block with same content checked twice
+	writeManifest(manifestPath, checkKey, results)
+	return (mergeChunkResults(check, group, [results[checksum] for start, end, checksum in blocks]), reusedBytes)
+
+
+def readManifest(manifestPath, checkKey):
+	"""Reads a block manifest. Returns dictionary with key = block checksum and value = ChunkResult, empty if
+	the manifest does not exist, is unreadable or was written with different check settings.
+	"""
+	try:
+		with open(manifestPath, 'rb') as f:
+			key, results = pickle.load(f)
+		if key == checkKey:
+			return results
+	except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+		pass
+	return dict()
+
+
+def writeManifest(manifestPath, checkKey, results):
+	"""Writes a block manifest (see checkDataSectionIncrementally())."""
+	with open(manifestPath + ".tmp", 'wb') as f:
+		pickle.dump( (checkKey, results), f, pickle.HIGHEST_PROTOCOL)
+	os.rename(manifestPath + ".tmp", manifestPath)
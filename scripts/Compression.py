@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Functions for reading and writing compressed data files.
+
+Supported are gzip (.gz), xz (.xz) and zstd (.zst) compressed files. Files are decompressed
+while being read (streaming), no temporary files are created.
+
+zstd support requires the python module 'zstandard', gzip and xz are supported by the
+python standard library.
+
+Archived files can be written in a block-based gzip format, that allows random access:
+the file is a sequence of independent gzip members (which every gzip reader decompresses as one
+stream). The first member holds the header section, each following member a block of complete
+data lines. The gzip header of each member stores the member size and uncompressed size in an
+extra field 'MV' and the time stamp of the first data line of the block as comment. The block
+index of a file is obtained by reading only the member headers, and a time range is read by
+decompressing only the blocks covering it.
+"""
+
+import gzip
+import io
+import lzma
+import os
+import struct
+import zlib
+
+# file name suffixes of supported compression formats
+COMPRESSION_SUFFIXES = ['.gz', '.xz', '.zst']
+
+# exceptions raised when reading corrupt/truncated compressed files
+DECOMPRESSION_ERRORS = (EOFError, gzip.BadGzipFile, lzma.LZMAError, zlib.error)
+try:
+	import zstandard
+	DECOMPRESSION_ERRORS = DECOMPRESSION_ERRORS + (zstandard.ZstdError,)
+except ImportError:
+	pass
+
+BLOCK_SIZE = 1024*1024
+
+# uncompressed size of the data blocks in the block-based gzip format
+GZIP_DATA_BLOCK_SIZE = 64*1024
+GZIP_FEXTRA = 4
+GZIP_FCOMMENT = 16
+
+
+def splitCompressionSuffix(fname):
+	"""Splits the compression suffix from a file name.
+
+	Returns tuple (file name without compression suffix, compression suffix), the compression
+	suffix is an empty string for uncompressed files.
+	"""
+	for suffix in COMPRESSION_SUFFIXES:
+		if fname.endswith(suffix):
+			return (fname[:-len(suffix)], suffix)
+	return (fname, '')
+
+
+def compressionSupported(suffix):
+	"""Returns True, if files with the given compression suffix can be read and written."""
+	if suffix == '.zst':
+		try:
+			import zstandard
+		except ImportError:
+			return False
+	return True
+
+
+def openBinary(filePath, suffix, mode='rb', data=None):
+	"""Opens a (compressed) file as binary stream, with 'rb' or 'wb' mode. The content of a file
+	already read into memory can be passed as data (read mode only), the file is then not opened again.
+	"""
+	if data != None:
+		if suffix == '.gz':
+			return gzip.GzipFile(fileobj=io.BytesIO(data))
+		elif suffix == '.xz':
+			return lzma.LZMAFile(io.BytesIO(data))
+		elif suffix == '.zst':
+			import zstandard
+			return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+		return io.BytesIO(data)
+	if suffix == '.gz':
+		return gzip.open(filePath, mode)
+	elif suffix == '.xz':
+		return lzma.open(filePath, mode)
+	elif suffix == '.zst':
+		import zstandard
+		f = open(filePath, mode)
+		if mode == 'rb':
+			return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True, closefd=True)
+		else:
+			return zstandard.ZstdCompressor().stream_writer(f, closefd=True)
+	return open(filePath, mode)
+
+
+def openText(filePath, suffix, data=None):
+	"""Opens a (compressed) file for reading in text mode.
+
+	Line endings are translated like in plain text mode, so that the content is read exactly
+	as from an uncompressed file. The content of a file already read into memory (as stored, i.e.
+	compressed) can be passed as data, the file is then not opened again.
+	"""
+	if data == None and suffix == '':
+		return open(filePath, 'r')
+	return io.TextIOWrapper(openBinary(filePath, suffix, data=data))
+
+
+def uncompressedSize(filePath, suffix):
+	"""Returns the size of the uncompressed content of a (compressed) file in bytes.
+
+	For files in block-based gzip format the size is taken from the block index. Otherwise the file
+	is decompressed (without storing the content) to determine the size: the size fields of gzip and
+	zstd files only hold the size of the last member/first frame, but uploaded files may consist of
+	several members/frames (e.g. concatenated files).
+	"""
+	if suffix == '':
+		return os.path.getsize(filePath)
+	if suffix == '.gz':
+		blocks = readBlockIndex(filePath)
+		if blocks != None:
+			return sum([b[2] for b in blocks])
+	size = 0
+	with openBinary(filePath, suffix) as f:
+		while True:
+			block = f.read(BLOCK_SIZE)
+			if not block:
+				break
+			size = size + len(block)
+	return size
+
+
+def recompressFile(srcPath, srcSuffix, targetPath, targetSuffix):
+	"""Copies a file with (re-)compression, i.e. decompresses the source file (if compressed) and
+	writes it compressed with the target format (or uncompressed, if targetSuffix is empty).
+	"""
+	with openBinary(srcPath, srcSuffix) as src:
+		with openBinary(targetPath, targetSuffix, 'wb') as target:
+			while True:
+				block = src.read(BLOCK_SIZE)
+				if not block:
+					break
+				target.write(block)
+
+
+def _writeGzipMember(f, data, comment):
+	"""Writes a gzip member with extra field 'MV' (member size, uncompressed size) and the
+	given comment to the binary file f.
+	"""
+	compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+	deflated = compressor.compress(data) + compressor.flush()
+	commentBytes = comment.encode('latin-1') + b'\0'
+	headerSize = 10 + 2 + 12 + len(commentBytes)
+	memberSize = headerSize + len(deflated) + 8
+	f.write(b'\x1f\x8b\x08' + bytes([GZIP_FEXTRA | GZIP_FCOMMENT]) + b'\0\0\0\0\0\xff')
+	f.write(struct.pack('<H', 12) + b'MV' + struct.pack('<HII', 8, memberSize, len(data)))
+	f.write(commentBytes)
+	f.write(deflated)
+	f.write(struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff))
+
+
+def writeBlockGzip(srcPath, srcSuffix, targetPath, blockSize=GZIP_DATA_BLOCK_SIZE):
+	"""Writes a data file in the block-based gzip format.
+
+	The source file (optionally compressed) is split into the header section (up to and including
+	the first empty line) and blocks of complete data lines with about blockSize bytes.
+	"""
+	with openBinary(srcPath, srcSuffix) as src:
+		with open(targetPath, 'wb') as f:
+			# header section
+			header = []
+			for line in src:
+				header.append(line)
+				if line.strip(b'\r\n') == b'':
+					break
+			_writeGzipMember(f, b''.join(header), '')
+			# data blocks
+			block = []
+			size = 0
+			for line in src:
+				block.append(line)
+				size = size + len(line)
+				if size >= blockSize:
+					_writeGzipMember(f, b''.join(block), block[0][:19].decode('latin-1'))
+					block = []
+					size = 0
+			if len(block) != 0:
+				_writeGzipMember(f, b''.join(block), block[0][:19].decode('latin-1'))
+
+
+def readBlockIndex(filePath):
+	"""Reads the block index of a file in block-based gzip format, only the member headers are read.
+
+	Returns list of tuples (offset, member size, uncompressed size, time stamp of first data line),
+	the first entry is the header section block (with empty time stamp). Returns None, if the file
+	is not in block-based gzip format or the member sizes are inconsistent with the file size.
+	"""
+	blocks = []
+	with open(filePath, 'rb') as f:
+		f.seek(0, os.SEEK_END)
+		fileSize = f.tell()
+		f.seek(0)
+		offset = 0
+		while True:
+			header = f.read(12)
+			if len(header) == 0:
+				break
+			if len(header) != 12 or header[:3] != b'\x1f\x8b\x08' or not (header[3] & GZIP_FEXTRA):
+				return None
+			extra = f.read(struct.unpack('<H', header[10:12])[0])
+			if len(extra) != 12 or extra[:2] != b'MV':
+				return None
+			memberSize, dataSize = struct.unpack('<II', extra[4:12])
+			# a member holds at least its header and must end within the file
+			if memberSize < 12 + len(extra) or offset + memberSize > fileSize:
+				return None
+			comment = b''
+			if header[3] & GZIP_FCOMMENT:
+				comment = f.read(32)
+				comment = comment[:comment.find(b'\0')]
+			blocks.append( (offset, memberSize, dataSize, comment.decode('latin-1')) )
+			offset = offset + memberSize
+			f.seek(offset)
+	if len(blocks) == 0:
+		return None
+	return blocks
+
+
+def readBlock(f, block):
+	"""Reads and decompresses a block of a file in block-based gzip format.
+
+	Arguments
+	---------
+	f
+	    File opened in binary mode
+	block
+	    Block index entry, as returned by readBlockIndex()
+
+	Returns decompressed block content as bytes.
+	"""
+	f.seek(block[0])
+	return zlib.decompress(f.read(block[1]), 16 + zlib.MAX_WBITS)
@@ -18,21 +18,45 @@ File contains the class ConfigFiles that encapsulate the various configuration f
 import json
 import re
 import os
-import platform
-import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import quote
 
+from ArchiveReader import findArchivedFile, readLastDataLine
+from ChunkCheck import createPool, dataSectionOffset, checkDataSectionInChunks, checkDataSectionIncrementally
+from Compression import splitCompressionSuffix, openText, uncompressedSize, DECOMPRESSION_ERRORS
 from Logger import error_log
 from print_funcs import *
+from SensorStats import SensorStats
+from TestGroups import TEST_GROUPS, FileCheck, READ_NONE, READ_STATS, TIME_STAMP_FORMAT
+
+
+class ExpectedFile:
+	"""Definition of an expected file (one entry of 'ExpectedFiles' in the exp file).
+
+	In the exp file, the definition is a list with 10 columns:
+	[prefix, test group, file size (exact or min.), max. file size, sample count, sample count tolerance,
+	 header reference file, content test definition file, sampling interval, sampling interval tolerance]
+
+	The derived values used in the checks (interval band, sample count band) are precomputed.
+	The processing priority of the prefix is set from the optional 'PrefixPriorities' object in the exp file,
+	the burst check of test group IBK_EventData from the optional 'EventBursts' object.
+	"""
+	__slots__ = ('prefix', 'testGroup', 'fileSize', 'fileSizeMax', 'sampleCount', 'sampleCountTol',
+	             'headerRefFile', 'contentDefFile', 'interval', 'intervalTol',
+	             'intervalMin', 'intervalMax', 'sampleCountMin', 'sampleCountMax', 'priority',
+	             'burstWindow', 'burstMaxEvents')
+
+	def __init__(self, definition):
+		(self.prefix, self.testGroup, self.fileSize, self.fileSizeMax, self.sampleCount, self.sampleCountTol,
+		 self.headerRefFile, self.contentDefFile, self.interval, self.intervalTol) = definition
+		self.intervalMin = self.interval - self.intervalTol
+		self.intervalMax = self.interval + self.intervalTol
+		self.sampleCountMin = self.sampleCount - self.sampleCountTol
+		self.sampleCountMax = self.sampleCount + self.sampleCountTol
+		self.priority = 0 # files of prefixes with higher priority are processed first (with --order priority)
+		self.burstWindow = 0 # length of burst window in seconds (IBK_EventData only), 0 disables burst check
+		self.burstMaxEvents = 0 # max. number of events allowed within any burst window
 
-TEST_GROUPS = [
-    'IBK_Mon_DHT22',
-    'IBK_Mon_1Wire',
-    'IBK_Mon_WinStat',
-    'IBK_Mon_conCom',
-    'IBK_TimeSeries',
-    'IBK_EventData',
-    'IBK_Custom' ]
 
 class ConfigFiles:
 	"""Class to read config files.
@@ -41,9 +65,25 @@ class ConfigFiles:
 	"""
 	def __init__(self):
 		self.configFilePath = ""
-		self.expectedFiles = dict() # dictionary for expected files, key = filename, value = array of attributes
+		self.expectedFiles = dict() # dictionary for expected files, key = filename, value = ExpectedFile object
 		self.bypassRules = []
 		self.headerDefinitions = dict()
+		self.contentDefinitions = dict() # parsed content test definition (.phy) files, key = file name
+		self.sampleState = None # optional SampleState object, enables continuity checks across files
+		self.archiveDir = None # optional archive directory, previous samples missing in sampleState are read from archived files
+		self.lastSample = None # tuple (prefix, time stamp, values) of last sample of the most recently checked file
+		self.collectStats = False # if True, sensor statistics are computed for fully checked files
+		self.lastStats = None # tuple (prefix, day string, statistics summary) of the most recently checked file
+		self.flagged = [] # warnings of the most recently checked file in 'Flag' mode, logged once the file is archived
+		self.memoryBudget = None # optional MemoryBudget object, memory held by the checks is claimed in it
+		self.maxErrorsPerCategory = 0 # 0 = stop checking a file at the first error, otherwise number of errors reported per category
+		self.fileErrors = dict() # error counts of the file currently being checked, key = error category
+		self.parallelWorkers = 1 # > 1 enables parallel chunk checks of large files
+		self.parallelMinSize = 64*1024*1024 # min. size of files checked in parallel chunks, in bytes
+		self.chunkPool = None # process pool for chunk checks, created on first use (or before threads are started, see chunkPoolAvailable())
+		self.manifestDir = None # optional directory of block manifests, enables incremental re-checks of large files
+		self.incrementalMinSize = 64*1024*1024 # min. size of files checked incrementally, in bytes
+		self.reusedBytes = 0 # total size of data blocks with check results reused from previous checks
 
 	def checkReferencedFile(self, name, refFile, fileType):
 		"""Checks, if a file referenced in the exp-file exists.
@@ -130,20 +170,45 @@ class ConfigFiles:
 				# check for valid numbers for toleranzes
 				if expectedFile[5] < 0:
 					raise RuntimeError("Error in definition of file '{}': negative value for tolerance '{}' is not allowed"
-					                   .format(name, expectedFile[9]))
+					                   .format(name, expectedFile[5]))
 				if expectedFile[9] < 0:
 					raise RuntimeError("Error in definition of file '{}': negative value for tolerance '{}' is not allowed"
 					                   .format(name, expectedFile[9]))
 				
 
 				# store file definition
-				self.expectedFiles[name] = expectedFile
+				self.expectedFiles[name] = ExpectedFile(expectedFile)
 				#print("Registering expected file pattern '{}'".format(name))
 				
 			if 'BypassFiles' in data:
 				for bypassRule in data['BypassFiles']:
 					self.bypassRules.append( bypassRule )
 
+			# optional processing priorities, key = file prefix, value = integer priority (default 0)
+			if 'PrefixPriorities' in data:
+				for name in data['PrefixPriorities']:
+					priority = data['PrefixPriorities'][name]
+					if name not in self.expectedFiles:
+						raise RuntimeError("Priority given for unknown file '{}'.".format(name))
+					if not isinstance(priority, int):
+						raise RuntimeError("Invalid priority '{}' for file '{}', expected integer value.".format(priority, name))
+					self.expectedFiles[name].priority = priority
+
+			# optional burst check of event data files, key = file prefix, value = [window length in seconds, max. events per window]
+			if 'EventBursts' in data:
+				for name in data['EventBursts']:
+					burstDef = data['EventBursts'][name]
+					if name not in self.expectedFiles:
+						raise RuntimeError("Event burst check given for unknown file '{}'.".format(name))
+					if self.expectedFiles[name].testGroup != 'IBK_EventData':
+						raise RuntimeError("Event burst check given for file '{}', which is not in test group 'IBK_EventData'.".format(name))
+					if (not isinstance(burstDef, list) or len(burstDef) != 2 or
+					    not all([isinstance(v, (int, float)) and v > 0 for v in burstDef])):
+						raise RuntimeError("Invalid event burst check '{}' for file '{}', expected [window length in seconds, max. events] "
+						                   "with positive values.".format(burstDef, name))
+					self.expectedFiles[name].burstWindow = burstDef[0]
+					self.expectedFiles[name].burstMaxEvents = burstDef[1]
+
 	def extractTimeStamp(self, fname):
 		"""Extracts time stamp from filename.
 		
@@ -204,7 +269,80 @@ class ConfigFiles:
 		return False
 
 
-	def entryCheckPassedForFile(self, dropboxDir, fname, ef):
+	def bypassRuleAppliesToDirectory(self, dirPath):
+		"""Tests, if all files below a directory (full path relative to dropbox folder) are
+		matched by a bypass rule, so that the directory can be bypassed as a whole.
+
+		This is the case, if a bypass rule is a prefix of the directory path, or if the regexp-search
+		matches the directory path and the regexp does not contain anchors or lookarounds (then the
+		match cannot depend on the rest of a file path below the directory).
+
+		Example:
+
+		'TestHaus/p1.4/' matches the directory 'TestHaus/p1.4/raw', but the rule 'TestHaus/dummy_'
+		does not match the directory 'TestHaus' (only some files in this directory are bypassed).
+
+		Arguments
+		---------
+		dirPath
+		    Directory path relative to dropbox directory, for example 'Haus1/Wg2'
+
+		Returns True, if a rule applies to all files in the directory.
+		"""
+
+		dirPath = dirPath + '/'
+		for bypassRule in self.bypassRules:
+			if dirPath.find(bypassRule) == 0:
+				return True
+			if re.search(r'\$|\\[ZbB]|\(\?<?[=!]', bypassRule):
+				continue # match may depend on the end of the file path
+			match = re.search(bypassRule, dirPath)
+			if match:
+				return True
+
+		return False
+
+
+	def reportFileError(self, category, fname, message):
+		"""Prints and logs an error found in the file currently being checked.
+
+		In fail-fast mode (maxErrorsPerCategory == 0) the error is always reported. Otherwise
+		only the first maxErrorsPerCategory errors of each category are reported, the remaining
+		ones are only counted and summarized in finishFileErrors().
+
+		Arguments
+		---------
+		category
+		    Error category
+		fname
+		    File path relative to dropbox directory
+		message
+		    The message text.
+
+		Returns True, if checking of the file shall stop, False if further errors shall be collected.
+		"""
+		count = self.fileErrors.get(category, 0) + 1
+		self.fileErrors[category] = count
+		if self.maxErrorsPerCategory == 0 or count <= self.maxErrorsPerCategory:
+			printError(message)
+			error_log(category, fname, message)
+		return self.maxErrorsPerCategory == 0
+
+
+	def finishFileErrors(self, fname):
+		"""Logs the number of errors that exceeded the per-category limit.
+
+		Returns True, if no errors were found in the file.
+		"""
+		for category in sorted(self.fileErrors):
+			suppressed = self.fileErrors[category] - self.maxErrorsPerCategory
+			if self.maxErrorsPerCategory != 0 and suppressed > 0:
+				printError("{} further errors of category '{}' not reported.".format(suppressed, category))
+				error_log(category, fname, "{} further errors of this category not reported.".format(suppressed))
+		return len(self.fileErrors) == 0
+
+
+	def entryCheckPassedForFile(self, dropboxDir, fname, ef, fullCheck=True, fileSize=None, data=None):
 		"""Tests, if the filename (full path relative to dropbox folder)
 		passes all entry checks.
 
@@ -217,7 +355,16 @@ class ConfigFiles:
 		fname
 		    File path relative to dropbox directory
 		ef
-		    ExpectedFile data definition array
+		    ExpectedFile object
+		fullCheck
+		    If False, only file name, file size and header are checked, but not the data section
+		fileSize
+		    File size in bytes, if already known from directory scan (avoids another stat call)
+		data
+		    Content of the file (as stored, i.e. compressed), if already read into memory (see Prefetch.py)
+
+		If maxErrorsPerCategory is set, the checks continue after errors found in header and data
+		section so that all errors of the file are reported in one pass.
 
 		Returns True, if all tests have passed successfully.
 		"""
@@ -226,6 +373,13 @@ class ConfigFiles:
 		fnameParts = fnameFixed.split('/')
 		filename = fnameParts[-1]
 		print("Processing file '{}'".format(filename))
+		self.lastSample = None
+		self.lastStats = None
+		self.flagged = []
+		self.fileErrors = dict()
+
+		# compressed files are checked by the name of the uncompressed file
+		filename, compression = splitCompressionSuffix(filename)
 
 		# file name check - check for correct number of _ and - characters
 		tokens = filename.split('_')
@@ -255,173 +409,338 @@ class ConfigFiles:
 			return False
 			
 
-		# determine test group
-		testGroup = ef[1]
+		# determine check pipeline of the test group
+		group = TEST_GROUPS[ef.testGroup]
 
-		# if test group is IBK_Custom, we just accept the file as-is
-		if testGroup == "IBK_Custom":
+		# if test group does not look at the file content (IBK_Custom), we just accept the file as-is
+		if group.readLevel == READ_NONE:
 			return True
 
 		fullPath = dropboxDir + '/' + fname
 		
 		# first check if file is empty
-		fileSize = os.path.getsize(fullPath) 
+		if fileSize == None:
+			fileSize = os.path.getsize(fullPath)
 		if fileSize == 0:
 			printError("File is empty.\n")
 			error_log('EmptyFile', fname, "")
 			return False
 
+		# for compressed files, all size checks use the size of the uncompressed content
+		compressedSize = None
+		if compression != '':
+			compressedSize = fileSize
+			try:
+				fileSize = uncompressedSize(fullPath, compression)
+			except DECOMPRESSION_ERRORS as e:
+				printError("Error decompressing file '{}': {}".format(fname, e))
+				error_log('CorruptFile', fname, "Error decompressing file: {}".format(e))
+				return False
+			except IOError as e:
+				self.reportAccessDenied(fname, fullPath)
+				return False
+
 		# test for correct header (done in all test groups), except header file definition is missing
-		if ef[6] != "":
-			if not ef[6] in self.headerDefinitions:
+		headerReference = None
+		if ef.headerRefFile != "":
+			if not ef.headerRefFile in self.headerDefinitions:
 				# try to read header file
 				try:
-					headerRefFile = self.configFilePath + "/" + ef[6]
+					headerRefFile = self.configFilePath + "/" + ef.headerRefFile
 					with open(headerRefFile, 'r') as f:
 						lines = f.readlines()
 					lines = [l.strip() for l in lines] # remove trailing /r and /n chars
-					self.headerDefinitions[ef[6]] = lines
+					self.headerDefinitions[ef.headerRefFile] = lines
 				except IOError as e:
 					printError("Error reading header reference file '{}'.".format(headerRefFile))
 					error_log('Critical', "Error reading header reference file '{}'.".format(headerRefFile), '')
 					exit(1)
+			headerReference = self.headerDefinitions[ef.headerRefFile]
 
-			headerReference = self.headerDefinitions[ef[6]]
-			try:
-				# now read all lines of the headerReference from file and compare line by line
-				with open(fullPath, 'r') as f:
-					errorLineCount = []
-					errorLines = []
-					expectedLines = []
-					lineCount = 0
-					for refLine in headerReference:
-						lineCount = lineCount + 1
-						line = f.readline().strip() # remove trailing /r and /n chars
-						if line != refLine:
-							expectedLines.append(refLine)
-							errorLines.append(line)
-							errorLineCount.append(lineCount)
-					if len(errorLineCount) != 0:
-						errorStrings = ""
-						for i in range(len(errorLineCount)):
-							errorStrings = errorStrings + "{:2d}: ".format(errorLineCount[i]) + expectedLines[i] + "\n" + "  : " + errorLines[i] + "\n"
-						printError("Header line mismatch:\n" + errorStrings)
-						error_log('InvalidHeader', fname, "Header line mismatch:\n" + errorStrings)
-						return False
-					
-			except IOError as e:
-				printError("Error reading data file '{}'.".format(fname))
-				# get ls output on Linux
-				permissions = ""
-				if platform.system() == "Linux":
-					proc = subprocess.Popen(['ls','-l',fullPath], stdout=subprocess.PIPE)
-					tmp = proc.stdout.read()
-					permissions = tmp[:tmp.find('/')]
-				error_log('AccessDenied', fname, permissions)
-				return False
-
+		# content test definition (missing value thresholds), only used when data section is parsed
+		contentDefinition = self.contentDefinition(ef)
 
-		# file size check, only if expected file size is given; not for testGroup "IBK_Mon_WinStat"
-		# Note: file size check is done *after* header check - so if header is correct and file size still differs,
-		#       the reason must be in the data section
-		expFileSize = ef[2]
-		if testGroup != "IBK_Mon_WinStat" and testGroup != "IBK_EventData":
-			expFileSizeMin = expFileSize # min and exact size are defined by the same parameter
-			expFileSizeMax = ef[3]
+		check = FileCheck(self, fname, ef)
+		# the data section is only read, if the test group requires it
+		readData = fullCheck and group.readLevel >= READ_STATS
+		if headerReference == None and not readData:
+			return self.fileSizeCheckPassed(check, group, fileSize, compressedSize) and self.finishFileErrors(fname)
 
-			# exact check only for support level 1
-			if testGroup == "IBK_Mon_1Wire":
-				if (expFileSize != 0 and expFileSize != fileSize):
-					printError("Mismatching file size, expected {} bytes, got {} bytes.".format(expFileSize, fileSize))
-					error_log('FileSizeMismatch', fname, "Mismatching file size, expected {} bytes, got {} bytes.".format(expFileSize, fileSize))
+		try:
+			# the file is read only once and only as far as needed by the test group
+			with openText(fullPath, compression, data) as f:
+				lines = (l.strip('\r\n') for l in f) # remove trailing /r and /n chars, but keep tabs
+
+				# read header section and extract SensorID line
+				headerLines = []
+				dataSectionFound = False
+				for line in lines:
+					if line == "":
+						dataSectionFound = True
+						break
+					headerLines.append(line)
+					if line.find("SensorID") == 0:
+						check.sensorTokens = line.split(',')
+
+				if headerReference != None and not self.headerCheckPassed(check, headerReference, headerLines):
 					return False
-			else:
-				if (expFileSizeMax != 0 and fileSize > expFileSizeMax) or (expFileSizeMin != 0 and fileSize < expFileSizeMin):
-					printError("File size {} bytes is not in expected size range [{}..{}] bytes."
-				               .format(fileSize, expFileSizeMin, expFileSizeMax))
-					error_log('FileSizeMismatch', fname, "File size {} bytes is not in expected size range [{}..{}] bytes."
-				              .format(fileSize, expFileSizeMin, expFileSizeMax))
+
+				# Note: file size check is done *after* header check - so if header is correct and file size still differs,
+				#       the reason must be in the data section
+				if not self.fileSizeCheckPassed(check, group, fileSize, compressedSize):
 					return False
 
+				if readData:
+					if not dataSectionFound:
+						printError("Data section missing in file '{}'.".format(fname))
+						error_log('SampleCountMismatch', fname, 'Data section missing in file.')
+						return False
 
-		# data line and interval checks
-		if testGroup != "IBK_EventData":
-			# read data file
-			try:
-				with open(fullPath, 'r') as f:
-					lines = f.readlines()
-					lines = [l.strip('\r\n') for l in lines] # remove trailing /r and /n chars, but keep tabs
-			except IOError as e:
-				printError("Error reading data file '{}'.".format(fname))
-				error_log('AccessDenied', fname, '')
+					# data line and interval checks
+					if group.readLevel == READ_STATS:
+						check.sampleCount = sum(1 for line in lines)
+					else:
+						check.prevSample = self.previousSample(ef, dstring)
+						# sensor statistics are also needed for the missing values check
+						if self.collectStats or contentDefinition != None:
+							check.stats = SensorStats(check.sensorTokens)
+						if (self.manifestDir != None and group.chunkable and compression == '' and
+						    fileSize >= self.incrementalMinSize):
+							# large files: results of unchanged blocks of a previous check of the file are reused
+							dataOffset = dataSectionOffset(fullPath)
+							pool = None
+							if self.parallelWorkers > 1 and self.chunkPoolAvailable():
+								pool = self.chunkPool
+							passed, reusedBytes = checkDataSectionIncrementally(check, group, fullPath, dataOffset, fileSize, pool,
+							                                                    self.maxErrorsPerCategory, self.manifestPath(fname))
+							if reusedBytes != 0:
+								print("Reused check results of {:.1f} MB unchanged data from previous check.".format(reusedBytes/1024/1024))
+								self.reusedBytes = self.reusedBytes + reusedBytes
+							if not passed:
+								return False
+						elif (self.parallelWorkers > 1 and group.chunkable and compression == '' and
+						      fileSize >= self.parallelMinSize and self.chunkPoolAvailable()):
+							dataOffset = dataSectionOffset(fullPath)
+							if not checkDataSectionInChunks(check, group, fullPath, dataOffset, fileSize, self.chunkPool,
+							                                self.parallelWorkers, self.maxErrorsPerCategory):
+								return False
+						elif not group.checkDataSection(check, lines):
+							return False
+
+					# check for sample count
+					msg = group.checkSampleCount(ef, check.sampleCount)
+					if msg != None and check.error('SampleCountMismatch', msg):
+						return False
+
+					if contentDefinition != None and check.stats != None:
+						if not self.missingValuesCheckPassed(check, contentDefinition):
+							return False
+
+					# remember last sample and statistics, so that they can be stored once the file is archived
+					if check.lastSample != None:
+						self.lastSample = (ef.prefix, check.lastSample[0], check.lastSample[1])
+					if self.collectStats and check.stats != None:
+						self.lastStats = (ef.prefix, dstring, check.stats.summary())
+
+		except DECOMPRESSION_ERRORS as e:
+			printError("Error decompressing file '{}': {}".format(fname, e))
+			error_log('CorruptFile', fname, "Error decompressing file: {}".format(e))
+			return False
+		except IOError as e:
+			self.reportAccessDenied(fname, fullPath)
+			return False
+
+		# in collect-all mode we also get here when errors were found
+		return self.finishFileErrors(fname)
+
+
+	def reportAccessDenied(self, fname, fullPath):
+		"""Reports a data file that cannot be read, with the file permissions (on Linux)."""
+		printError("Error reading data file '{}'.".format(fname))
+		# get ls output on Linux
+		permissions = ""
+		import platform
+		import subprocess
+		if platform.system() == "Linux":
+			proc = subprocess.Popen(['ls','-l',fullPath], stdout=subprocess.PIPE)
+			tmp = proc.stdout.read().decode()
+			permissions = tmp[:tmp.find('/')]
+		error_log('AccessDenied', fname, permissions)
+
+
+	def manifestPath(self, fname):
+		"""Returns path of the block manifest file of a file (path relative to dropbox directory)."""
+		return self.manifestDir + '/' + quote(fname, safe='')
+
+
+	def chunkPoolAvailable(self):
+		"""Creates the process pool for parallel chunk checks on first use.
+
+		The worker processes are forked, so the pool must be created before any other threads are started
+		(e.g. the read-ahead threads of a Prefetcher).
+
+		Returns True, if the pool is available.
+		"""
+		if self.chunkPool == None:
+			self.chunkPool = createPool(self.parallelWorkers)
+			if self.chunkPool == None:
+				printWarning("Parallel checks are not supported on this platform, files are checked sequentially.")
+				self.parallelWorkers = 1
 				return False
-			
-			# read over header section and extract SensorID line
-			blankLineIndex = 0
-			sensorTokens = []
-			while blankLineIndex < len(lines) and lines[blankLineIndex] != "":
-				if lines[blankLineIndex].find("SensorID") == 0:
-					sensorTokens = lines[blankLineIndex].split(',')
-				blankLineIndex = blankLineIndex + 1
-			if blankLineIndex == len(lines):
-				printError("Data section missing in file '{}'.".format(fname))
-				error_log('SampleCountMismatch', fname, 'Data section missing in file.')
+		return True
+
+
+	def closeChunkPool(self):
+		"""Terminates the worker processes of the chunk check pool, if created."""
+		if self.chunkPool != None:
+			self.chunkPool.close()
+			self.chunkPool.join()
+			self.chunkPool = None
+
+
+	def headerCheckPassed(self, check, headerReference, headerLines):
+		"""Compares the header lines of a file with the reference header line by line.
+
+		Returns False, if checking of the file shall stop due to an error.
+		"""
+		errorLineCount = []
+		errorLines = []
+		expectedLines = []
+		for i in range(len(headerReference)):
+			line = ""
+			if i < len(headerLines):
+				line = headerLines[i].strip() # also remove leading/trailing whitespace, like in reference
+			if line != headerReference[i]:
+				expectedLines.append(headerReference[i])
+				errorLines.append(line)
+				errorLineCount.append(i+1)
+		if len(errorLineCount) != 0:
+			errorStrings = ""
+			for i in range(len(errorLineCount)):
+				errorStrings = errorStrings + "{:2d}: ".format(errorLineCount[i]) + expectedLines[i] + "\n" + "  : " + errorLines[i] + "\n"
+			if check.error('InvalidHeader', "Header line mismatch:\n" + errorStrings):
 				return False
+		return True
 
-			# read data section, extract samples and compute time difference between samples
-			sampleCount = 0
-			lastTimeStamp = None
-			for i in range(blankLineIndex+1, len(lines)):
-				line = lines[i]
-				tokens = line.split(',')
-				if len(tokens) != len(sensorTokens):
-					printError("Data section in file '{}' contains line '{}' with mismatching column count (expected {}, got {} columns)"
-					           .format(fname, line, len(sensorTokens), len(tokens)))
-					error_log('ColumnCountMismatch', fname, "Data section in file '{}' contains line '{}' with mismatching column count (expected {}, got {} columns)"
-					           .format(fname, line, len(sensorTokens), len(tokens)))
-					return False
-				sampleCount = sampleCount + 1
-				# now parse time stamp
-				try:
-					ts = datetime.strptime(tokens[0], "%Y-%m-%d %H:%M:%S")
-				except ValueError:
-					printError("Data section in file '{}' contains invalid time stamp format '{}'"
-					           .format(fname, tokens[0]))
-					error_log('InvalidTimeStamp', fname, "Data section in file '{}' contains invalid time stamp format '{}'"
-					           .format(fname, tokens[0]))
-					return False
-				
-				if lastTimeStamp != None:
-					timeDiff = ts-lastTimeStamp
-					timeDiffSec = timeDiff.total_seconds()
-					# if we have a sample interval given, and the test is enabled, perform test
-					if ef[8] > 0:
-						minIntervalLength = ef[8] - ef[9]
-						maxIntervalLength = ef[8] + ef[9]
-						# if we have a toleranz > 0, compare with toleranz band
-						if timeDiffSec < minIntervalLength or timeDiffSec > maxIntervalLength:
-							if ef[9] == 0:
-								printError("Sampling interval before time stamp '{}' was {} s, but expected was {} s"
-									       .format(tokens[0], timeDiffSec, ef[8]))
-								error_log('InvalidSamplingInterval', fname, "Sampling interval before time stamp '{}' was {} s, but expected was {} s"
-									       .format(tokens[0], timeDiffSec, ef[8]))
-							else:
-								printError("Sampling interval before time stamp '{}' was {} s, but was expected in range [{},{}] s"
-									       .format(tokens[0], timeDiffSec, minIntervalLength, maxIntervalLength))
-								error_log('InvalidSamplingInterval', fname, "Sampling interval before time stamp '{}' was {} s, but was expected in range [{},{}] s"
-									       .format(tokens[0], timeDiffSec, minIntervalLength, maxIntervalLength))
-							return False
-				lastTimeStamp = ts
-			
-			# check for sample count
-			if testGroup != "IBK_Mon_WinStat":
-				expLineCount = ef[4]
-				if expLineCount != 0:
-					expLineMin = expLineCount - ef[5]
-					expLineMax = expLineCount + ef[5]
-					if sampleCount < expLineMin or sampleCount > expLineMax:
-						printError("Expected {} samples, got {}.".format(expLineCount, sampleCount))
-						error_log('SampleCountMismatch', fname, "Expected {} samples, got {}.".format(expLineCount, sampleCount))
-						return False
 
+	def fileSizeCheckPassed(self, check, group, fileSize, compressedSize=None):
+		"""Performs the file size check of the test group. For compressed files, fileSize is the
+		size of the uncompressed content and the compressed size is added to the error message.
+
+		Returns False, if checking of the file shall stop due to an error.
+		"""
+		msg = group.checkFileSize(check.ef, fileSize)
+		if msg != None and compressedSize != None:
+			msg = msg + " Compressed file size is {} bytes.".format(compressedSize)
+		if msg != None and check.error('FileSizeMismatch', msg):
+			return False
+		return True
+
+
+	def contentDefinition(self, ef):
+		"""Returns the content test definition (.phy file) of an expected file, or None if not given.
+
+		The .phy file is a JSON file with the (optional) missing value thresholds, given as ratio
+		of missing values ('' or '-') in the data section of a file:
+
+		{
+			"MissingThreshold" : 0.1,
+			"Sensors" : {
+				"11_TH01_T" : { "MissingThreshold" : 0.5 }
+			},
+			"MissingAction" : "Reject"
+		}
+
+		"MissingThreshold" applies to all sensors without own threshold (default: no check).
+		"MissingAction" is either "Reject" (default, file is moved to review) or "Flag" (file is
+		archived, but a warning is printed and logged once the file is archived).
+
+		Returns tuple (default threshold, dict with sensor thresholds, reject flag).
+		"""
+		if ef.contentDefFile == "":
+			return None
+		if not ef.contentDefFile in self.contentDefinitions:
+			contentDefFile = self.configFilePath + "/" + ef.contentDefFile
+			try:
+				with open(contentDefFile, 'r') as f:
+					data = json.load(f)
+				defaultThreshold = data.get('MissingThreshold')
+				sensorThresholds = dict()
+				for sensorId, sensorDef in data.get('Sensors', dict()).items():
+					if 'MissingThreshold' in sensorDef:
+						sensorThresholds[sensorId] = float(sensorDef['MissingThreshold'])
+				if defaultThreshold != None:
+					defaultThreshold = float(defaultThreshold)
+				action = data.get('MissingAction', 'Reject')
+				if action not in ['Reject', 'Flag']:
+					raise ValueError("Invalid MissingAction '{}'".format(action))
+			except (IOError, ValueError, TypeError, AttributeError) as e:
+				printError("Error reading content test definition file '{}'.".format(contentDefFile))
+				error_log('Critical', "Error reading content test definition file '{}'.".format(contentDefFile), str(e))
+				exit(1)
+			self.contentDefinitions[ef.contentDefFile] = (defaultThreshold, sensorThresholds, action == 'Reject')
+		return self.contentDefinitions[ef.contentDefFile]
+
+
+	def missingValuesCheckPassed(self, check, contentDefinition):
+		"""Compares the ratio of missing values of each sensor with the thresholds of the content test definition.
+
+		The missing value counts are taken from the sensor statistics, so no additional pass over
+		the data section is needed.
+
+		Returns False, if checking of the file shall stop due to an error.
+		"""
+		defaultThreshold, sensorThresholds, reject = contentDefinition
+		for sensorId, missing, total in check.stats.missingRatios():
+			threshold = sensorThresholds.get(sensorId, defaultThreshold)
+			if threshold == None or missing <= threshold*total:
+				continue
+			msg = ("Sensor '{}' has {:.1%} missing values ({} of {}), but at most {:.1%} are allowed."
+			       .format(sensorId, missing/total, missing, total, threshold))
+			if reject:
+				if check.error('MissingValues', msg):
+					return False
+			else:
+				printWarning(msg)
+				self.flagged.append("{} : {}".format(check.fname, msg))
 		return True
+
+
+	def previousSample(self, ef, dateString):
+		"""Returns the last sample of the previous file with the same prefix for the continuity check,
+		but only if it belongs to the previous day (or earlier on the same day); otherwise the gap is
+		reported by the missing files check. Returns None if there is no such sample.
+
+		If the sample state does not hold a matching sample (e.g. for late files of a backfill), the
+		last sample is read from the archived file of the previous day, if available.
+		"""
+		if ef.interval <= 0:
+			return None
+		fileDate = datetime.strptime(dateString, "%Y-%m-%d")
+		prevSample = None
+		if self.sampleState != None:
+			prevSample = self.sampleState.lastSample(ef.prefix)
+		if prevSample != None:
+			if prevSample[0] < fileDate - timedelta(days=1) or prevSample[0] >= fileDate + timedelta(days=1):
+				prevSample = None
+		if prevSample == None and self.archiveDir != None:
+			prevSample = self.archivedSample(ef.prefix, (fileDate - timedelta(days=1)).strftime("%Y-%m-%d"))
+		return prevSample
+
+
+	def archivedSample(self, prefix, dateString):
+		"""Reads the last sample of an archived file.
+
+		Returns tuple (time stamp, values), or None if the file does not exist or has no valid last sample.
+		"""
+		archivedFile = findArchivedFile(self.archiveDir, prefix, dateString)
+		if archivedFile == None:
+			return None
+		try:
+			line = readLastDataLine(archivedFile[0], archivedFile[1])
+			if line == None:
+				return None
+			tokens = line.split(',')
+			return (datetime.strptime(tokens[0], TIME_STAMP_FORMAT), tokens[1:])
+		except (IOError, ValueError) + DECOMPRESSION_ERRORS:
+			return None
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Directory scanning functions shared by the scripts.
+
+The scan is based on os.scandir() and returns file size and modification time together with the
+file path, so that no additional stat calls (os.path.getsize(), os.path.exists(), ...) are needed
+per file. This matters on network file systems, where every metadata request is a round-trip.
+"""
+
+import os
+
+
+def scanFiles(topDir, recursive=True):
+	"""Generator that yields all files below a directory.
+
+	Files of a directory are returned in sorted order, followed by the files of the
+	subdirectories (also processed in sorted order). Symbolic links to directories are
+	not followed.
+
+	Arguments
+	---------
+	topDir
+	    Directory to scan
+	recursive
+	    If False, only files directly in topDir are returned
+
+	Yields tuples (relPath, size, mtime) with relPath being the path relative to topDir
+	(always with / as separator), file size in bytes and modification time as returned by os.stat().
+	"""
+	subDirs = [''] # stack of directories relative to topDir
+	while len(subDirs) != 0:
+		relDir = subDirs.pop()
+		files = []
+		dirs = []
+		try:
+			with os.scandir(topDir + '/' + relDir if relDir else topDir) as it:
+				for entry in it:
+					relPath = relDir + '/' + entry.name if relDir else entry.name
+					if entry.is_dir(follow_symlinks=False):
+						dirs.append(relPath)
+					elif entry.is_file():
+						try:
+							st = entry.stat()
+						except OSError:
+							continue # file removed in the meantime
+						files.append( (relPath, st.st_size, st.st_mtime) )
+		except OSError:
+			continue # directory removed in the meantime or not accessible
+		files.sort()
+		for f in files:
+			yield f
+		if recursive:
+			# push in reverse order, so that subdirectories are processed in sorted order
+			subDirs.extend(sorted(dirs, reverse=True))
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class FingerprintIndex, an index of the content fingerprints (content size and hash)
+of all archived files, used to detect duplicate and overlapping files.
+"""
+
+import hashlib
+import json
+import os
+
+from Compression import splitCompressionSuffix, openBinary, DECOMPRESSION_ERRORS
+from print_funcs import *
+
+HASH_BLOCK_SIZE = 1024*1024
+
+
+def fileFingerprint(filePath, data=None, readCallback=None):
+	"""Computes the content fingerprint of a file.
+
+	For compressed files, the fingerprint is computed from the uncompressed content, so that a file
+	and its (re-)compressed copy in the archive have the same fingerprint.
+
+	Arguments
+	---------
+	filePath
+	    Path to the file, the compression suffix selects the decompression
+	data
+	    Optional file content (as stored, i.e. compressed), if already read into memory
+	readCallback
+	    Optional function, called with the number of (uncompressed) bytes of each block read
+
+	Returns string '<size>:<hash>' with size of the (uncompressed) content and hash being the hex digest
+	of a (fast) blake2b hash of the content.
+	"""
+	h = hashlib.blake2b(digest_size=16)
+	size = 0
+	with openBinary(filePath, splitCompressionSuffix(filePath)[1], data=data) as f:
+		while True:
+			block = f.read(HASH_BLOCK_SIZE)
+			if not block:
+				break
+			h.update(block)
+			size = size + len(block)
+			if readCallback != None:
+				readCallback(len(block))
+	return "{}:{}".format(size, h.hexdigest())
+
+
+def isDataFile(relPath):
+	"""Returns True, if an archived file is a data file (csv file, optionally compressed). Other files
+	in the archive (archive/missing.accepted) are not part of the index.
+	"""
+	return splitCompressionSuffix(relPath)[0][-4:].lower() == '.csv'
+
+
+class FingerprintIndex:
+	"""Persistent index of the content fingerprints of the archived files.
+
+	The index is kept in a json file (usually 'status/fingerprints') with one entry per archived
+	file (path relative to archive dir), holding file size, modification time and fingerprint.
+	When synchronizing the index with the archive directory, new or modified files are added without
+	fingerprint, they are hashed later with hashFile() (a bounded number of files per run, so that
+	indexing a large archive is spread over many runs).
+
+	Lookups by path (same prefix and date, i.e. overlapping time range) and by fingerprint
+	(identical content under a different name) are dictionary lookups. Lookups by path ignore
+	the compression suffix, i.e. 'x.csv' matches an archived 'x.csv.gz'.
+	"""
+	def __init__(self, indexFilePath):
+		self.indexFilePath = indexFilePath
+		self.entries = dict() # key = path relative to archive dir, value = tuple (size, mtime, fingerprint or None if not yet hashed)
+		self.byFingerprint = dict() # key = fingerprint, value = path relative to archive dir
+		self.byName = dict() # key = path without compression suffix, value = path relative to archive dir
+		self.modified = False
+		self.changes = dict() # entries changed in this run, key = path relative to archive dir, value = entry or None if removed
+		self.modifiedFiles = [] # archived files with size or modification time changed since last run, found by sync()
+
+	def read(self):
+		"""Reads index file, if existing. A corrupt index file is ignored (with warning), the index
+		is then rebuilt during synchronization with the archive.
+		"""
+		self.entries = dict()
+		self.modified = False
+		self.changes = dict()
+		if os.path.exists(self.indexFilePath):
+			try:
+				with open(self.indexFilePath, 'r') as f:
+					data = json.load(f)
+				for relPath in data:
+					size, mtime, fingerprint = data[relPath]
+					self.entries[relPath] = (size, mtime, fingerprint)
+			except (ValueError, TypeError, IOError) as e:
+				printWarning("Cannot read fingerprint index '{}', index is rebuilt.".format(self.indexFilePath))
+				self.entries = dict()
+		self.byFingerprint = dict()
+		self.byName = dict()
+		for relPath in self.entries:
+			if self.entries[relPath][2] != None:
+				self.byFingerprint[self.entries[relPath][2]] = relPath
+			self.byName[splitCompressionSuffix(relPath)[0]] = relPath
+
+	def write(self):
+		"""Writes index file, but only if it was modified in this run.
+
+		Changes of concurrent runs are merged, i.e. the index file is read again and the entries
+		added/removed in this run are applied to it.
+		"""
+		if not self.modified:
+			return
+		changes = self.changes
+		self.read()
+		for relPath in changes:
+			if changes[relPath] == None:
+				if relPath in self.entries:
+					self.remove(relPath)
+			elif changes[relPath][2] == None and self.entries.get(relPath, (None, None))[:2] == changes[relPath][:2]:
+				continue # file hashed by a concurrent run
+			else:
+				self.add(relPath, *changes[relPath])
+		data = dict()
+		for relPath in self.entries:
+			data[relPath] = list(self.entries[relPath])
+		# write to temporary file first and rename afterwards, so that an interrupted run
+		# does not leave a truncated index file behind
+		with open(self.indexFilePath + ".tmp", 'w') as f:
+			json.dump(data, f, sort_keys=True, separators=(',', ':'))
+		os.rename(self.indexFilePath + ".tmp", self.indexFilePath)
+		self.modified = False
+		self.changes = dict()
+
+	def sync(self, archiveFiles):
+		"""Updates the index to the current content of the archive directory. Only sizes and modification
+		times are compared, no files are read: new archived files and files modified since they were added
+		to the index (size or modification time changed, listed in modifiedFiles) are added without
+		fingerprint, see unhashedFiles() and hashFile().
+
+		Arguments
+		---------
+		archiveFiles
+		    List of tuples (relPath, size, mtime) of all files in the archive dir, as returned by scanFiles(),
+		    only data files are indexed
+		"""
+		existing = set()
+		self.modifiedFiles = []
+		for relPath, fileSize, mtime in archiveFiles:
+			if not isDataFile(relPath):
+				continue
+			existing.add(relPath)
+			entry = self.entries.get(relPath)
+			if entry != None:
+				if entry[0] == fileSize and entry[1] == mtime:
+					continue # unchanged since last run
+				self.modifiedFiles.append(relPath)
+			self.add(relPath, fileSize, mtime, None)
+		# remove files no longer in the archive
+		for relPath in [p for p in self.entries if p not in existing]:
+			self.remove(relPath)
+
+	def add(self, relPath, fileSize, mtime, fingerprint):
+		"""Adds/updates an archived file in the index."""
+		if relPath in self.entries:
+			self.remove(relPath)
+		self.entries[relPath] = (fileSize, mtime, fingerprint)
+		if fingerprint != None:
+			self.byFingerprint[fingerprint] = relPath
+		self.byName[splitCompressionSuffix(relPath)[0]] = relPath
+		self.modified = True
+		self.changes[relPath] = (fileSize, mtime, fingerprint)
+
+	def remove(self, relPath):
+		"""Removes an archived file from the index."""
+		fingerprint = self.entries.pop(relPath)[2]
+		name = splitCompressionSuffix(relPath)[0]
+		if self.byName.get(name) == relPath:
+			del self.byName[name]
+		if self.byFingerprint.get(fingerprint) == relPath:
+			del self.byFingerprint[fingerprint]
+			# another archived file may have the same content
+			for p in self.entries:
+				if self.entries[p][2] == fingerprint:
+					self.byFingerprint[fingerprint] = p
+					break
+		self.modified = True
+		self.changes[relPath] = None
+
+	def unhashedFiles(self):
+		"""Returns sorted list of the archived files without fingerprint (paths relative to archive dir)."""
+		return sorted([p for p in self.entries if self.entries[p][2] == None])
+
+	def hashFile(self, archiveDir, relPath, readCallback=None):
+		"""Computes the fingerprint of an archived file in the index and stores it.
+
+		Arguments
+		---------
+		archiveDir
+		    Archive directory
+		relPath
+		    Path relative to archive dir
+		readCallback
+		    Optional function, called with the number of bytes of each block read (see fileFingerprint())
+
+		Returns the fingerprint, or None if the file cannot be read (with warning, the file is hashed
+		again in the next run).
+		"""
+		try:
+			fingerprint = fileFingerprint(archiveDir + '/' + relPath, readCallback=readCallback)
+		except (IOError,) + DECOMPRESSION_ERRORS:
+			printWarning("Cannot read archived file '{}' to compute fingerprint.".format(relPath))
+			return None
+		fileSize, mtime = self.entries[relPath][:2]
+		self.add(relPath, fileSize, mtime, fingerprint)
+		return fingerprint
+
+	def archivedFileWithName(self, relPath):
+		"""Returns path of the archived file with the same name as the given file (ignoring the
+		compression suffix), or None if there is no such file in the archive.
+		"""
+		return self.byName.get(splitCompressionSuffix(relPath)[0])
+
+	def fingerprintOf(self, relPath):
+		"""Returns fingerprint of an archived file, or None if the file is not in the archive or not yet hashed."""
+		entry = self.entries.get(relPath)
+		return entry[2] if entry != None else None
+
+	def archivedFileWithFingerprint(self, fingerprint):
+		"""Returns path of an archived file with the given fingerprint, or None."""
+		return self.byFingerprint.get(fingerprint)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class LeaseLock, an advisory lock based on lease files, used to coordinate
+concurrent runs of MonVerifyTool.py on the same project (also from several hosts on a shared file system).
+
+A lease file holds host name, process id, a random token and the expiry time of the lease. It is
+created atomically with os.link() of a temporary file, which fails if the lease file exists (this
+also works on NFS). The owner renews the lease while working. A lease is stale, if it has expired
+or if the owning process (on the same host) no longer exists. Stale leases are broken by renaming
+the lease file, so that only one of several competing processes succeeds.
+"""
+
+import json
+import os
+import socket
+import time
+import uuid
+from urllib.parse import quote
+
+# default lease time in seconds, leases are renewed after a quarter of this time
+LEASE_TIME = 600
+
+
+def leaseName(prefix):
+	"""Returns the lease name of an expected file prefix (usable as file name)."""
+	return 'prefix_' + quote(prefix, safe='')
+
+
+class LeaseLock:
+	"""Advisory lock for a named resource (the project or a file prefix), held by a lease file
+	'<name>.lease' in the lease directory.
+	"""
+	def __init__(self, leaseDir, name, leaseTime=LEASE_TIME):
+		self.leaseDir = leaseDir
+		self.leaseFilePath = leaseDir + '/' + name + '.lease'
+		self.leaseTime = leaseTime
+		self.host = socket.gethostname()
+		self.pid = os.getpid()
+		self.token = uuid.uuid4().hex
+		self.held = False
+		self.renewTime = 0 # time of last acquisition/renewal
+		self.owner = None # 'host:pid' of other owner, when acquisition failed
+
+	def _writeLeaseFile(self, filePath):
+		"""Writes lease content with new expiry time to the given file."""
+		with open(filePath, 'w') as f:
+			json.dump({'host' : self.host, 'pid' : self.pid, 'token' : self.token,
+			           'expires' : time.time() + self.leaseTime}, f)
+
+	def _readLease(self, filePath):
+		"""Returns content of a lease file as dict, or None if the file does not exist or is
+		incomplete (i.e. still being written).
+		"""
+		try:
+			with open(filePath, 'r') as f:
+				return json.load(f)
+		except (IOError, ValueError):
+			return None
+
+	def _isStale(self, lease):
+		"""Tests if a lease has expired or its owner process has terminated."""
+		if lease['expires'] < time.time():
+			return True
+		if lease['host'] == self.host:
+			try:
+				os.kill(lease['pid'], 0)
+			except ProcessLookupError:
+				return True
+			except PermissionError:
+				pass # process exists, but belongs to another user
+		return False
+
+	def acquire(self):
+		"""Tries to acquire the lease, stale leases are broken. Does not wait.
+
+		Returns True, if the lease is held now.
+		"""
+		if self.held:
+			return True
+		if not os.path.exists(self.leaseDir):
+			os.makedirs(self.leaseDir, exist_ok=True)
+		tmpFilePath = "{}.{}.tmp".format(self.leaseFilePath, self.token)
+		self._writeLeaseFile(tmpFilePath)
+		try:
+			for attempt in range(2):
+				try:
+					os.link(tmpFilePath, self.leaseFilePath)
+					self.held = True
+					self.renewTime = time.time()
+					self.owner = None
+					return True
+				except FileExistsError:
+					pass
+				lease = self._readLease(self.leaseFilePath)
+				if lease == None:
+					# lease file vanished (released) or is incomplete: the latter is considered stale
+					# only when it was not modified for a full lease time
+					try:
+						if os.path.getmtime(self.leaseFilePath) + self.leaseTime > time.time():
+							self.owner = 'unknown'
+							return False
+					except OSError:
+						continue # released in the meantime, try again
+					lease = {'token' : None}
+				elif not self._isStale(lease):
+					self.owner = "{}:{}".format(lease['host'], lease['pid'])
+					return False
+				# break stale lease: only one process can rename the lease file
+				staleFilePath = "{}.{}.stale".format(self.leaseFilePath, self.token)
+				try:
+					os.rename(self.leaseFilePath, staleFilePath)
+				except OSError:
+					continue # broken by another process
+				staleLease = self._readLease(staleFilePath)
+				if staleLease != None and staleLease.get('token') != lease.get('token'):
+					# another process broke the stale lease and acquired it in the meantime: restore its lease
+					try:
+						os.link(staleFilePath, self.leaseFilePath)
+					except OSError:
+						pass
+					os.remove(staleFilePath)
+					self.owner = "{}:{}".format(staleLease['host'], staleLease['pid'])
+					return False
+				os.remove(staleFilePath)
+			self.owner = 'unknown'
+			return False
+		finally:
+			os.remove(tmpFilePath)
+
+	def acquireWait(self, timeout):
+		"""Acquires the lease, waits up to timeout seconds if it is held by another process.
+
+		Returns True, if the lease is held now.
+		"""
+		endTime = time.time() + timeout
+		while not self.acquire():
+			if time.time() > endTime:
+				return False
+			time.sleep(1)
+		return True
+
+	def renew(self, force=False):
+		"""Renews the lease, if a quarter of the lease time has passed since the last renewal
+		(or always, if force is True).
+
+		Returns False, if the lease was lost (i.e. broken by another process after expiry).
+		"""
+		if not self.held:
+			return False
+		if not force and time.time() - self.renewTime < self.leaseTime/4:
+			return True
+		lease = self._readLease(self.leaseFilePath)
+		if lease == None or lease.get('token') != self.token:
+			self.held = False
+			return False
+		tmpFilePath = "{}.{}.tmp".format(self.leaseFilePath, self.token)
+		self._writeLeaseFile(tmpFilePath)
+		os.replace(tmpFilePath, self.leaseFilePath)
+		self.renewTime = time.time()
+		return True
+
+	def release(self):
+		"""Releases the lease (the lease file is only removed, if it still belongs to this process)."""
+		if not self.held:
+			return
+		self.held = False
+		lease = self._readLease(self.leaseFilePath)
+		if lease != None and lease.get('token') == self.token:
+			try:
+				os.remove(self.leaseFilePath)
+			except OSError:
+				pass
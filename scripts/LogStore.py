@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class LogStore, an indexed store for the entries of the log files 'log/processed'
+and 'log/errors_<time stamp>' (see Logger.py), used by compactLogs.py and queryLogs.py.
+
+The store is partitioned by month: each month is kept in an sqlite database 'YYYY-MM.sqlite' in the
+store directory (usually 'log/store'), with the tables 'processed' and 'errors'. Both tables are
+indexed by file prefix and by category (each with time stamp), so that queries for a prefix or
+category within a time range only read the partitions of the time range and use index lookups.
+
+The prefix of a logged file is the part of the file path before the date, for example
+'Fehlertests/Test_' for file 'Fehlertests/Test_2016-03-04_00-00-00.csv'.
+
+Each compacted log file is recorded in table 'sources' of the partitions it was added to, so that
+an interrupted compaction can be repeated without adding entries twice.
+"""
+
+import os
+import re
+import sqlite3
+
+# log file entries: processed log has time stamp, category and path, error log has category, path and
+# message (message may span several lines)
+PROCESSED_LINE_REGEX = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) *\t(\S*) *\t(.*)$')
+ERROR_LINE_REGEX = re.compile(r'^([A-Za-z]+) *\t(.*?) *\t(.*)$')
+PREFIX_REGEX = re.compile(r'^(.*_)\d{4}-\d{2}-\d{2}_')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (ts TEXT, category TEXT, path TEXT, prefix TEXT);
+CREATE TABLE IF NOT EXISTS errors (ts TEXT, category TEXT, path TEXT, prefix TEXT, message TEXT);
+CREATE TABLE IF NOT EXISTS sources (name TEXT PRIMARY KEY);
+CREATE INDEX IF NOT EXISTS processed_prefix ON processed (prefix, ts);
+CREATE INDEX IF NOT EXISTS processed_category ON processed (category, ts);
+CREATE INDEX IF NOT EXISTS errors_prefix ON errors (prefix, ts);
+CREATE INDEX IF NOT EXISTS errors_category ON errors (category, ts);
+"""
+
+
+def filePrefix(path):
+	"""Returns the prefix of a logged file path (part before the date), or the path itself if it contains no date."""
+	m = PREFIX_REGEX.match(path)
+	return m.group(1) if m != None else path
+
+
+def parseProcessedLog(filePath):
+	"""Generator that yields the entries of a processed log file as tuples (time stamp, category, path)."""
+	with open(filePath, 'r', errors='replace') as f:
+		for line in f:
+			m = PROCESSED_LINE_REGEX.match(line.rstrip('\r\n'))
+			if m != None:
+				yield m.groups()
+
+
+def parseErrorLog(filePath):
+	"""Generator that yields the entries of an error log file as tuples (category, path, message).
+	Lines not starting with an error category are continuation lines of the message of the previous entry.
+	"""
+	entry = None
+	with open(filePath, 'r', errors='replace') as f:
+		for line in f:
+			line = line.rstrip('\r\n')
+			m = ERROR_LINE_REGEX.match(line)
+			if m != None:
+				if entry != None:
+					yield tuple(entry)
+				entry = list(m.groups())
+			elif entry != None:
+				entry[2] = entry[2] + '\n' + line
+	if entry != None:
+		yield tuple(entry)
+
+
+class LogStore:
+	"""Log entries partitioned by month into sqlite databases."""
+	def __init__(self, storeDir):
+		self.storeDir = storeDir
+		self.connections = dict() # key = month 'YYYY-MM', value = sqlite3 connection
+
+	def months(self):
+		"""Returns sorted list of months 'YYYY-MM' with existing partitions."""
+		if not os.path.exists(self.storeDir):
+			return []
+		return sorted([f[:7] for f in os.listdir(self.storeDir) if re.match(r'^\d{4}-\d{2}\.sqlite$', f)])
+
+	def connect(self, month):
+		"""Returns the connection to the partition of a month, the partition is created if missing."""
+		con = self.connections.get(month)
+		if con == None:
+			if not os.path.exists(self.storeDir):
+				os.makedirs(self.storeDir)
+			con = sqlite3.connect(self.storeDir + '/' + month + '.sqlite')
+			con.executescript(SCHEMA)
+			self.connections[month] = con
+		return con
+
+	def close(self):
+		"""Closes all partitions."""
+		for con in self.connections.values():
+			con.close()
+		self.connections = dict()
+
+	def _addEntries(self, sourceName, table, rowsByMonth):
+		"""Adds rows to the partitions, together with the source record (one transaction per partition).
+		Partitions already holding the source are skipped.
+		"""
+		count = 0
+		for month in sorted(rowsByMonth):
+			con = self.connect(month)
+			with con:
+				if con.execute("SELECT 1 FROM sources WHERE name = ?", (sourceName,)).fetchone() != None:
+					continue # added by previous, interrupted compaction
+				con.execute("INSERT INTO sources (name) VALUES (?)", (sourceName,))
+				if table == 'processed':
+					con.executemany("INSERT INTO processed (ts, category, path, prefix) VALUES (?,?,?,?)", rowsByMonth[month])
+				else:
+					con.executemany("INSERT INTO errors (ts, category, path, prefix, message) VALUES (?,?,?,?,?)", rowsByMonth[month])
+				count = count + len(rowsByMonth[month])
+		return count
+
+	def addProcessedLog(self, filePath, sourceName):
+		"""Adds the entries of a processed log file. Returns number of added entries."""
+		rowsByMonth = dict()
+		for ts, category, path in parseProcessedLog(filePath):
+			rowsByMonth.setdefault(ts[:7], []).append( (ts, category, path, filePrefix(path)) )
+		return self._addEntries(sourceName, 'processed', rowsByMonth)
+
+	def addErrorLog(self, filePath, sourceName, ts):
+		"""Adds the entries of an error log file of a run started at time stamp ts ('YYYY-MM-DD HH:MM:SS').
+		Returns number of added entries.
+		"""
+		rows = [(ts, category, path, filePrefix(path), message) for category, path, message in parseErrorLog(filePath)]
+		if len(rows) == 0:
+			return 0
+		return self._addEntries(sourceName, 'errors', {ts[:7] : rows})
+
+	def query(self, table, prefix=None, category=None, start=None, end=None, newestFirst=False, limit=0):
+		"""Generator that yields the entries of a table ('processed' or 'errors') matching the filters.
+
+		Arguments
+		---------
+		table
+		    'processed' or 'errors'
+		prefix
+		    File prefix, may contain glob wildcards (* and ?)
+		category
+		    Category of entries
+		start, end
+		    Time range, given as time stamp strings 'YYYY-MM-DD HH:MM:SS' (start inclusive, end exclusive)
+		newestFirst
+		    If True, entries are returned with newest entries first
+		limit
+		    Max. number of entries returned (0 = no limit)
+
+		Yields tuples (time stamp, category, path, message), message is None for table 'processed'.
+		"""
+		columns = "ts, category, path, message" if table == 'errors' else "ts, category, path, NULL"
+		conditions = []
+		params = []
+		if prefix != None:
+			if '*' in prefix or '?' in prefix:
+				conditions.append("prefix GLOB ?")
+			else:
+				conditions.append("prefix = ?")
+			params.append(prefix)
+		if category != None:
+			conditions.append("category = ?")
+			params.append(category)
+		if start != None:
+			conditions.append("ts >= ?")
+			params.append(start)
+		if end != None:
+			conditions.append("ts < ?")
+			params.append(end)
+		sql = "SELECT {} FROM {}".format(columns, table)
+		if len(conditions) != 0:
+			sql = sql + " WHERE " + " AND ".join(conditions)
+		sql = sql + " ORDER BY ts DESC" if newestFirst else sql + " ORDER BY ts"
+		if limit > 0:
+			sql = sql + " LIMIT {}".format(limit)
+		# only partitions within the time range are read
+		months = [m for m in self.months() if (start == None or m >= start[:7]) and (end == None or m <= end[:7])]
+		if newestFirst:
+			months.reverse()
+		count = 0
+		for month in months:
+			for row in self.connect(month).execute(sql, params):
+				yield row
+				count = count + 1
+				if limit > 0 and count >= limit:
+					return
@@ -16,8 +16,9 @@ import os
 from print_funcs import *
 
 
-LOG_DIR = "" # set in MonVerifyTool script
+LOG_DIR = "" # set in MonVerifyTool script, None disables writing of log files (dry runs)
 TIME_STAMP = "" # time stamp for start of main script run, set in MonVerifyTool script
+ERROR_HANDLER = None # optional function(category, filepath, message) receiving errors instead of the error log file
 
 def process_log(category, filepath):
 	"""Opens the log file and appends a log message with given type. 
@@ -30,6 +31,8 @@ def process_log(category, filepath):
 	- filepath
 	    path to the file (relative to dropbox directory)
 	"""
+	if LOG_DIR == None:
+		return
 	with open(LOG_DIR + "/processed", 'a') as f:
 		f.write("{:20s}\t{:10s}\t{}\n".format(datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S'), category, filepath))
 
@@ -46,6 +49,11 @@ def error_log(category, filepath, message):
 	- message
 		The message text.
 	"""
+	if ERROR_HANDLER != None:
+		ERROR_HANDLER(category, filepath, message)
+		return
+	if LOG_DIR == None:
+		return
 	todaysErrorLogFile = LOG_DIR + "/errors_{}".format(TIME_STAMP)
 	with open(todaysErrorLogFile, 'a') as f:
 		f.write("{:20s}\t{:50s}\t{}\n".format(category, filepath, message))
@@ -53,5 +61,7 @@ def error_log(category, filepath, message):
 	# create/update symlink to current error log file
 	errorSymlinkFile = LOG_DIR + "/errors"
 	if not os.path.exists(errorSymlinkFile) or os.path.realpath(errorSymlinkFile) != os.path.realpath(todaysErrorLogFile):
-		os.symlink(todaysErrorLogFile, errorSymlinkFile+".tmp")
-		os.rename(errorSymlinkFile+".tmp", errorSymlinkFile)
+		# temporary link name is unique per process, since concurrent runs may update the link
+		tmpSymlinkFile = "{}.{}.tmp".format(errorSymlinkFile, os.getpid())
+		os.symlink(todaysErrorLogFile, tmpSymlinkFile)
+		os.rename(tmpSymlinkFile, errorSymlinkFile)
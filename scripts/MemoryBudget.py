@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class MemoryBudget, which limits the memory held by the stages of the processing
+pipeline (file content read ahead and data held by the checks).
+
+The read-ahead reserves the memory of a file before reading it into memory and releases it, once
+the file is processed. When the budget is used up, a reservation waits until memory is released
+by other stages or threads (backpressure). Files larger than a fraction of the budget are never held
+in memory, they are processed in streaming mode (read line by line while checking).
+
+The checks cannot wait for memory (they run on the thread consuming the read-ahead), they claim the
+memory they hold without waiting, so that the read-ahead pauses until it is released.
+"""
+
+import threading
+import time
+
+# files larger than 1/STREAMING_FRACTION of the budget are processed in streaming mode
+STREAMING_FRACTION = 4
+
+
+class MemoryBudget:
+	"""Memory budget, shared by all threads reserving memory in it.
+
+	A budget may be part of a parent budget (for example the memory of one stage as part of the
+	memory of the whole pipeline), then reservations count against both budgets.
+
+	Arguments
+	---------
+	limit
+	    Max. total size of reservations in bytes
+	parent
+	    Optional parent MemoryBudget object
+	"""
+	def __init__(self, limit, parent=None):
+		self.limit = limit
+		self.parent = parent
+		self.condition = threading.Condition()
+		self.reserved = 0 # bytes currently reserved
+		self.peak = 0 # max. bytes reserved at a time
+		self.waitTime = 0 # total time threads waited for memory, in seconds
+		self.streamingSize = limit // STREAMING_FRACTION # larger files are processed in streaming mode
+		if parent != None:
+			self.streamingSize = min(self.streamingSize, parent.streamingSize)
+
+	def reserve(self, size, aborted=None):
+		"""Reserves memory, waits until enough memory is available. A reservation always succeeds, if
+		nothing else is reserved.
+
+		Arguments
+		---------
+		size
+		    Bytes to reserve
+		aborted
+		    Optional function, waiting is stopped when it returns True (re-evaluated after wake())
+
+		Returns True, if memory was reserved, False if waiting was aborted.
+		"""
+		with self.condition:
+			if self.reserved != 0 and self.reserved + size > self.limit:
+				waitStart = time.time()
+				while self.reserved != 0 and self.reserved + size > self.limit:
+					if aborted != None and aborted():
+						return False
+					self.condition.wait()
+				self.waitTime = self.waitTime + time.time() - waitStart
+			self.reserved = self.reserved + size
+			self.peak = max(self.peak, self.reserved)
+		if self.parent != None and not self.parent.reserve(size, aborted):
+			self.release(size, False)
+			return False
+		return True
+
+	def claim(self, size):
+		"""Reserves memory without waiting, even if the budget is exceeded. Used for memory that is held
+		anyway, other reservations wait until it is released.
+		"""
+		with self.condition:
+			self.reserved = self.reserved + size
+			self.peak = max(self.peak, self.reserved)
+		if self.parent != None:
+			self.parent.claim(size)
+
+	def release(self, size, releaseParent=True):
+		"""Releases reserved memory."""
+		with self.condition:
+			self.reserved = self.reserved - size
+			self.condition.notify_all()
+		if releaseParent and self.parent != None:
+			self.parent.release(size)
+
+	def wake(self):
+		"""Wakes up all waiting threads, so that they re-evaluate their abort condition."""
+		with self.condition:
+			self.condition.notify_all()
+		if self.parent != None:
+			self.parent.wake()
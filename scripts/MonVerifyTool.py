@@ -22,73 +22,51 @@ Error handling:
 
 Syntax:
 
-    > MonVerifyTool.py [<path/to/serverRoot>]
+    > MonVerifyTool.py [options] [<path/to/serverRoot>]
   
 If no path is given as argument, the current working directory is expected to be the server root.
+Use --help for a description of all options.
 """
 
+# Note: only modules needed for the idle run check are imported here, all others are imported
+#       after the fast exit check further below (see section 'fast exit for idle runs').
 import os
-import stat
-import platform
 import argparse
-import shutil # for copyfile
 import datetime
-import glob
+import time
 
 from print_funcs import *
-from ConfigFiles import ConfigFiles
-from Logger import process_log, error_log
-import Logger
+from DirScan import scanFiles
+
+# default lease time in seconds, same as LEASE_TIME in LeaseLock.py (not imported before the idle run check)
+DEFAULT_LEASE_TIME = 600
 
-def checkForMissingFiles(archiveDir, reviewDir, projectConfig):
+def checkForMissingFiles(archiveDir, reviewDir, projectConfig, archivedPaths, backlogPaths=set()):
 	"""
 	Generates file names (based on the expectation file) for all expected files and tests, if these
 	are present in the archiveDir *or* in the reviewDir.
+	archivedPaths holds the paths (relative to archiveDir) of all files in the archive, backlogPaths the
+	paths (without compression suffix) of files left in the dropbox dir for later runs (or other runs).
 	Also, a file reviewDir/missing.accepted is merged with archiveDir/missing.accepted. The files listed
-	in archiveDir/missing.accepted are ignored in the missing test.
+	in archiveDir/missing.accepted (single files or prefix patterns with date ranges, see AcceptedMissing.py)
+	are ignored in the missing test. archiveDir/missing.accepted is only rewritten if entries were added.
 	"""
 	
 	missingAcceptedFile = archiveDir + '/missing.accepted'
 	missingAcceptedFileReview = reviewDir + '/missing.accepted'
 	
 	# now read in missing files that were already accepted as missing from $archivedir/missing.accepted file
-	acceptedMissing = dict()
-	if os.path.exists(missingAcceptedFile):
-		lines = []
-		with open(missingAcceptedFile, 'r') as fobj:
-			lines = fobj.readlines()
-		for l in lines:
-			l = l.strip()
-			if len(l) == 0:
-				continue
-			i = l.find(" ")
-			if i == -1:
-				acceptedMissing[l] = '' # no comment for file
-			else:
-				acceptedMissing[l[0:i]] = l[i:]
+	acceptedMissing = AcceptedMissing()
+	acceptedMissing.read(missingAcceptedFile)
+	acceptedMissing.modified = False
 	
-	if os.path.exists(missingAcceptedFileReview):
-		lines = []
-		with open(missingAcceptedFileReview, 'r') as fobj:
-			lines = fobj.readlines()
-		for l in lines:
-			l = l.strip()
-			if len(l) == 0:
-				continue
-			i = l.find(" ")
-			if i == -1:
-				acceptedMissing[l] = '' # no comment for file
-			else:
-				acceptedMissing[l[0:i]] = l[i:]
+	if acceptedMissing.read(missingAcceptedFileReview):
+		# now dump out the missing file again, but only if new entries were added
+		if acceptedMissing.modified:
+			acceptedMissing.write(missingAcceptedFile)
 		# and remove the missing.accepted file now
 		os.remove(missingAcceptedFileReview)
 	
-	# now dump out the missing file again
-	if len(acceptedMissing) != 0:
-		with open(missingAcceptedFile, 'w') as fobj:
-			for k in sorted(acceptedMissing):
-				fobj.write("{} {}\n".format(k, acceptedMissing[k].strip()))
-	
 	# first collect a list of expected files
 	archivedFiles = dict() # key is the expected file prefix, value is a list a of files found in archive directory
 	# initialize map
@@ -96,25 +74,12 @@ def checkForMissingFiles(archiveDir, reviewDir, projectConfig):
 		archivedFiles[exp] = []
 	
 	# now process all files in archive dir
-	archivePathParts = archiveDir.split('/') # split into path components
-	for root, dirs, files in os.walk(archiveDir, topdown=False):
-	
-		rootStr = root.replace('\\', '/') # windows fix
-		pathParts = rootStr.split('/') # split into component
-		pathParts = pathParts[len(archivePathParts):] # keep only path parts below toplevel dir
-	
-		# check for valid files
-		for nf in files:
-			if len(pathParts) == 0:
-				newFilePath = nf
-			else:
-				newFilePath = "/".join(pathParts) + "/" + nf
-			
-			# insert into appropriate list
-			for exp in projectConfig.expectedFiles:
-				if newFilePath.find(exp) == 0:
-					archivedFiles[exp].append(nf)
-					break
+	for newFilePath in archivedPaths:
+		# insert into appropriate list
+		for exp in projectConfig.expectedFiles:
+			if newFilePath.find(exp) == 0:
+				archivedFiles[exp].append(splitCompressionSuffix(os.path.basename(newFilePath))[0])
+				break
 	
 	
 	missingFiles = []
@@ -122,6 +87,7 @@ def checkForMissingFiles(archiveDir, reviewDir, projectConfig):
 	# now process all directories and get a sorted list
 	for exp in projectConfig.expectedFiles:
 		af = sorted(archivedFiles[exp])
+		afSet = set(af) # for fast lookup
 		# skip empty directories/not existing expected files
 		if len(af) == 0:
 			# we skip todays file, so there's nothing to report
@@ -135,10 +101,11 @@ def checkForMissingFiles(archiveDir, reviewDir, projectConfig):
 		todaysDate = datetime.datetime.today()
 		d = firstDate + datetime.timedelta(1) # add one day
 		while d <= todaysDate:
-			dStr = exp + d.strftime('%Y-%m-%d_00-00-00.csv')
-			if not dStr in af:
+			dayStr = d.strftime('%Y-%m-%d')
+			dStr = exp + dayStr + '_00-00-00.csv'
+			if not dStr in afSet and not dStr in backlogPaths:
 				# only add missing files if they are not in the accepted list
-				if not dStr in acceptedMissing:
+				if not acceptedMissing.isAccepted(exp, dayStr, dStr):
 					missingFiles.append( dStr )
 			d = d + datetime.timedelta(1) # add one day
 	
@@ -157,22 +124,310 @@ def checkForMissingFiles(archiveDir, reviewDir, projectConfig):
 	return (retcode,len(missingFiles))
 
 
+def isTodaysFile(fname):
+	"""Returns True, if the file name (without directory) holds the date of the current day,
+	i.e. the file is still being recorded.
+	"""
+	# split filename at _
+	tokens = fname.split('_')
+	if len(tokens) == 3 and len(tokens[1])==10:
+		fileDate = datetime.datetime.strptime(tokens[1], '%Y-%m-%d')
+		todaysDate = datetime.datetime.today()
+		if fileDate.date() == todaysDate.date():
+			return True
+	return False
+
+
+def isIdleRun(dropboxDir, reviewDir, archiveDir, configDir, missingCheckStampFile, uploadMarkers):
+	"""Tests if there is nothing to do in this run, i.e. no new files in the dropbox directory,
+	no files in the review directory that are moved back to dropbox, and the missing files check
+	would give the same result as in the last run.
+
+	Files of the current day and upload marker files in the dropbox directory are not processed
+	and therefore ignored. The missing files check is due when the stamp file written by the last
+	check is missing or from a previous day, or when the .exp file or archive/missing.accepted were
+	modified afterwards.
+	"""
+	for relPath, fileSize, mtime in scanFiles(dropboxDir):
+		if isTodaysFile(os.path.basename(relPath)):
+			continue
+		if any([relPath.endswith(marker) for marker in uploadMarkers]):
+			continue
+		return False # any other file in dropbox needs processing
+	for relPath, fileSize, mtime in scanFiles(reviewDir):
+		from Compression import splitCompressionSuffix # only imported if needed, see imports above
+		# compressed csv files are moved back as well (see copy())
+		if splitCompressionSuffix(relPath)[0][-4:].lower() == '.csv' or relPath == 'missing.accepted':
+			return False
+	try:
+		stampTime = os.stat(missingCheckStampFile).st_mtime
+	except OSError:
+		return False
+	if datetime.date.fromtimestamp(stampTime) != datetime.date.today():
+		return False
+	checkedFiles = [configDir + '/' + f for f in os.listdir(configDir) if f[-4:] == '.exp']
+	checkedFiles.append(archiveDir + '/missing.accepted')
+	for f in checkedFiles:
+		try:
+			if os.stat(f).st_mtime > stampTime:
+				return False
+		except OSError:
+			pass
+	return True
+
+
+def uploadInProgress(relPath, mtime, dropboxPaths, uploadMarkers, settleTime, now):
+	"""Pre-flight test for files still being written into the dropbox directory, based on the
+	directory scan only (no file content is read).
+
+	A file is considered in progress if it was modified less than settleTime seconds ago, or if
+	it is an upload marker/temporary upload file (name ends with one of the upload marker suffixes),
+	or if a marker file with the file name plus a marker suffix exists next to it.
+
+	Arguments
+	---------
+	relPath
+	    File path relative to dropbox dir
+	mtime
+	    Modification time of the file
+	dropboxPaths
+	    Set of paths (relative to dropbox dir) of all files in dropbox dir
+	uploadMarkers
+	    List of upload marker suffixes, for example ['.part', '.uploading']
+	settleTime
+	    Time in seconds a file must remain unmodified before it is verified
+	now
+	    Current time (seconds since epoch)
+
+	Returns reason why the file is deferred, or None if the file can be verified.
+	"""
+	for marker in uploadMarkers:
+		if relPath.endswith(marker):
+			return "upload marker/temporary upload file"
+		if relPath + marker in dropboxPaths:
+			return "upload marker '{}' exists".format(relPath + marker)
+	if now - mtime < settleTime:
+		return "modified {:.0f} seconds ago".format(max(0, now - mtime))
+	return None
+
+
+def printRemainingFiles(reviewDir):
+	"""Prints the list of files in the review directory and returns the number of files."""
+	print("\nRemaining files in review directory:")
+
+	# if review directory is not empty, print list of open files
+	revFileCount = 0
+	for relFile, fileSize, mtime in scanFiles(reviewDir):
+		print(relFile)
+		revFileCount = revFileCount + 1
+
+	print("")
+	return revFileCount
+
+
+def printMissingFiles(logDir):
+	"""Prints the list of missing files written by the last missing files check."""
+	print("\nList of missing files:")
+	if os.path.exists(logDir + "/missing"):
+		fobj = open(logDir + "/missing")
+		print(fobj.read())
+		del fobj
+
+
+def moveFile(srcDir, targetDir, relPath):
+	"""Moves a file given by its path relative to srcDir to the same relative path
+	below targetDir. Missing subdirectories in targetDir are created.
+	"""
+	targetPath = targetDir + "/" + relPath
+	targetSubDir = os.path.dirname(targetPath)
+	if not os.path.exists(targetSubDir):
+		os.makedirs(targetSubDir)
+	shutil.move(srcDir + '/' + relPath, targetPath)
+
+
+def moveDirectory(srcDir, targetDir, relPath):
+	"""Moves a directory given by its path relative to srcDir to the same relative path below
+	targetDir. If the directory does not yet exist in targetDir, it is moved in a single operation,
+	otherwise its content is merged into the existing directory (existing files are replaced,
+	as in moveFile()). An empty directory is left in srcDir.
+	"""
+	targetPath = targetDir + "/" + relPath
+	if not os.path.exists(targetPath):
+		targetSubDir = os.path.dirname(targetPath)
+		if not os.path.exists(targetSubDir):
+			os.makedirs(targetSubDir)
+		shutil.move(srcDir + '/' + relPath, targetPath)
+		os.mkdir(srcDir + '/' + relPath)
+		return
+	with os.scandir(srcDir + '/' + relPath) as it:
+		entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+	for name, isDir in entries:
+		if isDir and os.path.isdir(targetPath + '/' + name):
+			moveDirectory(srcDir, targetDir, relPath + '/' + name)
+			os.rmdir(srcDir + '/' + relPath + '/' + name)
+		else:
+			shutil.move(srcDir + '/' + relPath + '/' + name, targetPath + '/' + name)
+
+
+def findBypassedDirectories(dropboxDir, projectConfig):
+	"""Returns list of paths (relative to dropbox dir) of the topmost subdirectories of the dropbox
+	directory, whose files are all matched by a bypass rule (see ConfigFiles.bypassRuleAppliesToDirectory()).
+	"""
+	bypassedDirs = []
+	subDirs = [''] # stack of directories relative to dropboxDir
+	while len(subDirs) != 0:
+		relDir = subDirs.pop()
+		try:
+			with os.scandir(dropboxDir + '/' + relDir if relDir else dropboxDir) as it:
+				dirs = [relDir + '/' + entry.name if relDir else entry.name for entry in it if entry.is_dir(follow_symlinks=False)]
+		except OSError:
+			continue # directory removed in the meantime or not accessible
+		for d in sorted(dirs, reverse=True):
+			if projectConfig.bypassRuleAppliesToDirectory(d):
+				bypassedDirs.append(d)
+			else:
+				subDirs.append(d)
+	return sorted(bypassedDirs)
+
+
+def archiveFile(dropboxDir, archiveDir, relPath, archiveCompression):
+	"""Moves a verified file to the archive directory, with optional (re-)compression.
+
+	Arguments
+	---------
+	relPath
+	    File path relative to dropbox dir
+	archiveCompression
+	    'keep' to archive the file as received, 'none' to store it uncompressed, or one of 'gz', 'xz', 'zst'
+	    to (re-)compress the file with this format; 'gz' uses the block-based gzip format that allows
+	    reading single time ranges without decompressing the whole file
+
+	Returns tuple (path of the archived file relative to archive dir, True if the file was (re-)compressed).
+	"""
+	baseName, compression = splitCompressionSuffix(relPath)
+	if archiveCompression == 'keep':
+		targetCompression = compression
+	elif archiveCompression == 'none':
+		targetCompression = ''
+	else:
+		targetCompression = '.' + archiveCompression
+	# gzip files not yet in block-based format are converted
+	if targetCompression == compression and (targetCompression != '.gz' or archiveCompression == 'keep' or
+	                                         readBlockIndex(dropboxDir + '/' + relPath) != None):
+		moveFile(dropboxDir, archiveDir, relPath)
+		return (relPath, False)
+	targetRelPath = baseName + targetCompression
+	targetPath = archiveDir + '/' + targetRelPath
+	targetSubDir = os.path.dirname(targetPath)
+	if not os.path.exists(targetSubDir):
+		os.makedirs(targetSubDir)
+	# write to temporary file first, so that an interrupted run does not leave a truncated archive file
+	if targetCompression == '.gz':
+		writeBlockGzip(dropboxDir + '/' + relPath, compression, targetPath + '.tmp')
+	else:
+		recompressFile(dropboxDir + '/' + relPath, compression, targetPath + '.tmp', targetCompression)
+	os.rename(targetPath + '.tmp', targetPath)
+	os.remove(dropboxDir + '/' + relPath)
+	return (targetRelPath, True)
+
+
+def selectSampleFiles(pendingFiles, sampleFraction, sampleMode):
+	"""Selects the files that get the full data checks in tiered verification mode.
+
+	For each expected file prefix at least one file is selected. In mode 'stratified' the
+	selected files are spread evenly over the date-sorted files of a prefix, in mode 'random'
+	they are picked randomly.
+
+	Arguments
+	---------
+	pendingFiles
+	    List of tuples (file path relative to dropbox dir, expected file definition, file size, modification time)
+	sampleFraction
+	    Fraction of files per prefix to select (0..1)
+	sampleMode
+	    Either 'stratified' or 'random'
+
+	Returns set of file paths (relative to dropbox dir) of the selected files.
+	"""
+	filesByPrefix = dict()
+	for newFilePath, ef, fileSize, mtime in pendingFiles:
+		filesByPrefix.setdefault(ef.prefix, []).append(newFilePath)
+	sampledFiles = set()
+	for prefix in filesByPrefix:
+		files = sorted(filesByPrefix[prefix])
+		count = max(1, int(math.ceil(len(files)*sampleFraction)))
+		if sampleMode == 'random':
+			sampledFiles.update(random.sample(files, count))
+		else:
+			for i in range(count):
+				sampledFiles.add(files[int((i + 0.5)*len(files)/count)])
+	return sampledFiles
+
+
+def scheduleFiles(pendingFiles, order):
+	"""Sorts the pending files in processing order.
+
+	Arguments
+	---------
+	pendingFiles
+	    List of tuples (file path relative to dropbox dir, expected file definition, file size, modification time)
+	order
+	    'name' (path order, i.e. per prefix oldest file first), 'oldest' or 'newest' (by date in file name),
+	    'priority' (by prefix priority from exp file, highest first, then path order) or 'smallest' (by file size)
+
+	With 'newest', the continuity check across file boundaries is only done for files whose previous day
+	is already archived, since files are not processed in chronological order.
+	"""
+	def fileDate(pf):
+		return pf[0][len(pf[1].prefix):len(pf[1].prefix) + 10]
+	# sort is stable, i.e. files with the same sort key are kept in path order
+	pendingFiles.sort(key=lambda pf: pf[0])
+	if order == 'oldest':
+		pendingFiles.sort(key=fileDate)
+	elif order == 'newest':
+		pendingFiles.sort(key=fileDate, reverse=True)
+	elif order == 'priority':
+		pendingFiles.sort(key=lambda pf: -pf[1].priority)
+	elif order == 'smallest':
+		pendingFiles.sort(key=lambda pf: pf[2])
+
+
+def identicalFiles(filePath1, filePath2):
+	"""Returns True, if both files have the same (uncompressed) content. Corrupt compressed files are
+	considered different."""
+	try:
+		return fileFingerprint(filePath1) == fileFingerprint(filePath2)
+	except DECOMPRESSION_ERRORS:
+		return False
+
+
 def copy(src, dest, pattern='.csv'):
 	"""Utility function to recursively copy a directory structure, or rather
 	only files in a directory structure with a given pattern.
-	Existing files in target location are not overwritten.
+	Existing files in target location are not overwritten, but reported as duplicate files.
+	If both files are identical, the file in the source directory is removed, otherwise it is
+	kept in the source directory.
+
+	Returns set of paths (relative to dest) of existing files with content differing from the source file.
 	"""
 
-	for root, dirs, files in os.walk(src):
-		for f in files:
-			if f[-len(pattern):].lower() == pattern:
-				# if target file does not exist, move the file from review to dropbox
-				targetFile = os.path.join(dest, f)
-				if not os.path.exists(targetFile):
-					shutil.move(os.path.join(root, f), targetFile)
-				else:
-					print("File {} in review directory already exists as {} in dropbox!".format(f, targetFile))
-					exit(1) # this is a critical error
+	conflictingFiles = set()
+	for relPath, fileSize, mtime in scanFiles(src):
+		# compressed files are copied as well
+		if splitCompressionSuffix(relPath)[0][-len(pattern):].lower() == pattern:
+			# if target file does not exist, move the file from review to dropbox
+			targetFile = dest + "/" + relPath
+			if not os.path.exists(targetFile):
+				moveFile(src, dest, relPath)
+			elif identicalFiles(src + "/" + relPath, targetFile):
+				printWarning("File '{}' in review directory is identical to file in dropbox, removing file in review directory.".format(relPath))
+				error_log('DuplicateFile', relPath, "File in review directory is identical to file in dropbox, removed file in review directory.")
+				os.remove(src + "/" + relPath)
+			else:
+				printError("File '{}' in review directory already exists in dropbox with different content, both files are kept.".format(relPath))
+				error_log('DuplicateFile', relPath, "File in review directory already exists in dropbox with different content.")
+				conflictingFiles.add(relPath)
+	return conflictingFiles
 
 
 # ---- main ----
@@ -180,8 +435,108 @@ def copy(src, dest, pattern='.csv'):
 # command line arguments
 parser = argparse.ArgumentParser(description="Process incoming files and perform conversions and sanity checks.")
 parser.add_argument('projectDir', nargs='?', help='Root directory for a project to process.', default=os.getcwd())
+parser.add_argument('--collect-errors', dest='collectErrors', type=int, default=0, metavar='N',
+                    help='Continue checking a file after an error and report up to N errors per error category and file '
+                         '(default 0 = stop at first error).')
+parser.add_argument('--sample-fraction', dest='sampleFraction', type=float, default=1.0, metavar='F',
+                    help='Tiered verification for large backfills: all files get the file name, size and header checks, but '
+                         'only a fraction F (0..1) of the files per prefix gets the full data checks. If a sampled file fails, '
+                         'all files of this prefix are fully checked (default 1 = full checks for all files).')
+parser.add_argument('--sample-mode', dest='sampleMode', choices=['stratified', 'random'], default='stratified',
+                    help='Selection of sampled files in tiered verification (default: stratified).')
+parser.add_argument('--full-run', dest='fullRun', action='store_true',
+                    help='Always run all checks, even if there are no new files and the missing files check is not due.')
+parser.add_argument('--archive-compression', dest='archiveCompression', choices=['keep', 'none', 'gz', 'xz', 'zst'], default='keep',
+                    help='Compression of archived files: keep compression of the received file (default), store uncompressed (none) '
+                         'or (re-)compress with gzip, xz or zstd. With gz, files are written in a block-based format '
+                         'that allows reading single time ranges (see exportData.py).')
+parser.add_argument('--parallel-workers', dest='parallelWorkers', type=int, default=1, metavar='N',
+                    help='Check the data section of large files in N parallel chunks (default 1 = sequential check).')
+parser.add_argument('--parallel-min-size', dest='parallelMinSize', type=int, default=64, metavar='MB',
+                    help='Min. size of files checked in parallel chunks, in MB (default 64).')
+parser.add_argument('--incremental-min-size', dest='incrementalMinSize', type=int, default=64, metavar='MB',
+                    help='Files of at least MB megabytes are checked in blocks, and the block checksums and results are kept '
+                         '(in status/manifests) while the file is in the review directory. When the corrected file is checked '
+                         'again, only the changed blocks are checked (default 64, 0 = no incremental checks).')
+parser.add_argument('--prefetch-memory', dest='prefetchMemory', type=int, default=0, metavar='MB',
+                    help='Read the next files ahead on background threads, holding at most MB megabytes in memory. Speeds up '
+                         'the processing of many small files on network file systems (default 0 = no read-ahead).')
+parser.add_argument('--prefetch-threads', dest='prefetchThreads', type=int, default=4, metavar='N',
+                    help='Number of read-ahead threads (default 4).')
+parser.add_argument('--memory-budget', dest='memoryBudget', type=int, default=0, metavar='MB',
+                    help='Max. memory in MB for file content read ahead plus the event data held by the checks (time stamps '
+                         'of IBK_EventData files). Reading ahead pauses while the budget is used up, files larger than a '
+                         'quarter of the budget are processed in streaming mode. Requires --prefetch-memory '
+                         '(default 0 = only limited by --prefetch-memory).')
+parser.add_argument('--settle-time', dest='settleTime', type=int, default=60, metavar='SEC',
+                    help='Files in the dropbox directory modified less than SEC seconds ago are still being uploaded '
+                         'and are deferred to a later run (default 60, 0 disables the test).')
+parser.add_argument('--upload-marker', dest='uploadMarkers', action='append', default=[], metavar='SUFFIX',
+                    help="Suffix of upload marker files, for example '.part'. Files ending with SUFFIX are ignored, "
+                         "and a file is deferred while a file with its name plus SUFFIX exists. Can be given multiple times.")
+parser.add_argument('--max-runtime', dest='maxRuntime', type=int, default=0, metavar='SEC',
+                    help='Time budget of a run in seconds: no further files are verified once the budget is used up or the '
+                         'next file is not expected to finish within the budget. Remaining files are left unchanged in the '
+                         'dropbox directory for the next run (default 0 = no limit).')
+parser.add_argument('--order', dest='order', choices=['name', 'oldest', 'newest', 'priority', 'smallest'], default='name',
+                    help="Processing order of files in the dropbox directory: by path (default), by date in file name "
+                         "(oldest or newest first), by prefix priority ('PrefixPriorities' in exp file, highest first) "
+                         "or smallest file first.")
+parser.add_argument('--shard', dest='shard', metavar='K/N',
+                    help='Process only the file prefixes of shard K of N (prefixes are assigned to shards by a hash of the '
+                         'prefix name), for running several instances concurrently on one project. Files not matching any '
+                         'prefix are handled by shard 1.')
+parser.add_argument('--lease-time', dest='leaseTime', type=int, default=DEFAULT_LEASE_TIME, metavar='SEC',
+                    help='Lease time of the locks held by a run (in status/locks), a lease not renewed within this time is '
+                         'considered stale and is taken over by other runs (default {}).'.format(DEFAULT_LEASE_TIME))
+parser.add_argument('--scrub-slice', dest='scrubSlice', type=int, default=0, metavar='N',
+                    help='Scrub N archived files per run: the files are checked against the checksums in the fingerprint '
+                         'index and with the current checks. Files are scrubbed in path order, continuing in the next run '
+                         '(progress in status/scrubstate), until the whole archive was checked (default 0 = no scrubbing).')
+parser.add_argument('--scrub-bandwidth', dest='scrubBandwidth', type=float, default=10, metavar='MB/s',
+                    help='Max. read rate of archive scrubbing and of hashing archived files for the fingerprint index '
+                         'in MB/s (default 10, 0 = no limit).')
+parser.add_argument('--index-slice', dest='indexSlice', type=int, default=1000, metavar='N',
+                    help='Hash at most N archived files per run that are not yet in the fingerprint index (e.g. in the '
+                         'first run with an existing archive), within the time budget (default 1000, 0 = no limit).')
+parser.add_argument('--no-stats', dest='noStats', action='store_true',
+                    help='Do not compute the per-sensor statistics of archived files (directory stats).')
 
 args = parser.parse_args()
+startTime = time.time()
+if args.scrubSlice < 0 or args.scrubBandwidth < 0 or args.indexSlice < 0:
+	parser.error("--scrub-slice, --scrub-bandwidth and --index-slice must not be negative")
+if args.maxRuntime < 0:
+	parser.error("--max-runtime must not be negative")
+if args.prefetchMemory < 0 or args.prefetchThreads < 1:
+	parser.error("--prefetch-memory must not be negative and --prefetch-threads must be at least 1")
+if args.incrementalMinSize < 0:
+	parser.error("--incremental-min-size must not be negative")
+if args.memoryBudget < 0:
+	parser.error("--memory-budget must not be negative")
+if args.memoryBudget > 0 and args.prefetchMemory == 0:
+	parser.error("--memory-budget requires --prefetch-memory, the checks do not wait for memory")
+shardIndex, shardCount = 0, 1
+if args.shard != None:
+	try:
+		shardIndex, shardCount = [int(v) for v in args.shard.split('/')]
+	except ValueError:
+		parser.error("--shard must be given as K/N, for example 1/4")
+	if shardCount < 1 or shardIndex < 1 or shardIndex > shardCount:
+		parser.error("--shard K/N requires 1 <= K <= N")
+	shardIndex = shardIndex - 1
+if args.leaseTime < 10:
+	parser.error("--lease-time must be at least 10 seconds")
+if args.settleTime < 0:
+	parser.error("--settle-time must not be negative")
+if '' in args.uploadMarkers:
+	parser.error("--upload-marker must not be empty")
+if args.sampleFraction <= 0 or args.sampleFraction > 1:
+	parser.error("--sample-fraction must be in the range (0..1]")
+if args.archiveCompression == 'zst':
+	from Compression import compressionSupported
+	if not compressionSupported('.zst'):
+		parser.error("--archive-compression zst requires the python module 'zstandard'")
 
 print("Processing directory '{}'".format(args.projectDir))
 
@@ -205,10 +560,55 @@ configDir = args.projectDir + "/config"
 statusDir = args.projectDir + "/status"
 logDir = args.projectDir + "/log"
 archiveDir = args.projectDir + "/archive"
+statsDir = args.projectDir + "/stats"
 dropboxDir = args.projectDir + "/dropbox"
 reviewDir = args.projectDir + "/review"
 bypassDir = args.projectDir + "/bypass"
 
+missingCheckStampFile = statusDir + "/missingcheck"
+
+# ---- fast exit for idle runs ----
+
+# When called frequently (e.g. every minute by cron), most runs have nothing to do. In this case
+# we only print the results of the last run and skip reading the config and importing the remaining modules.
+# Runs scrubbing the archive always have something to do.
+if not args.fullRun and args.scrubSlice == 0 and isIdleRun(dropboxDir, reviewDir, archiveDir, configDir, missingCheckStampFile, args.uploadMarkers):
+	retcode = 0
+	missingFileCount = 0
+	if os.path.exists(logDir + "/missing"):
+		with open(logDir + "/missing") as fobj:
+			missingFileCount = len([l for l in fobj if len(l.strip()) != 0])
+	if missingFileCount != 0:
+		printMissingFiles(logDir)
+	revFileCount = printRemainingFiles(reviewDir)
+	if revFileCount != 0:
+		print("There are {} files remaining in the review directory.".format(revFileCount))
+		retcode = 1
+	if missingFileCount != 0:
+		print("There are {} missing files.".format(missingFileCount))
+		retcode = 1
+	exit(retcode)
+
+import shutil # for copyfile
+import math
+import random
+import atexit
+import zlib
+from urllib.parse import unquote
+
+from ConfigFiles import ConfigFiles
+from AcceptedMissing import AcceptedMissing
+from SampleState import SampleState
+from SensorStats import DailyStats
+from FingerprintIndex import FingerprintIndex, fileFingerprint, isDataFile
+from ArchiveScrub import ScrubState, IoThrottle, throttledFingerprint
+from Prefetch import Prefetcher
+from MemoryBudget import MemoryBudget
+from LeaseLock import LeaseLock, leaseName
+from Compression import splitCompressionSuffix, compressionSupported, recompressFile, writeBlockGzip, readBlockIndex, DECOMPRESSION_ERRORS
+from Logger import process_log, error_log
+import Logger
+
 Logger.LOG_DIR = logDir
 Logger.TIME_STAMP = datetime.datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
 
@@ -229,6 +629,12 @@ if len(expFiles) != 1:
 	exit(1)
 
 projectConfig = ConfigFiles()
+projectConfig.maxErrorsPerCategory = max(0, args.collectErrors)
+projectConfig.parallelWorkers = max(1, args.parallelWorkers)
+projectConfig.parallelMinSize = args.parallelMinSize*1024*1024
+if args.incrementalMinSize > 0:
+	projectConfig.manifestDir = statusDir + "/manifests"
+	projectConfig.incrementalMinSize = args.incrementalMinSize*1024*1024
 try:
 	projectConfig.readExp(configDir + '/' + expFiles[0])
 except RuntimeError as e:
@@ -249,113 +655,465 @@ if len(projectConfig.expectedFiles) == 0:
 	error_log('Critical', "No files expected in this project. Please add content to the ExpectedFiles attribute!", '')
 	exit(1)
 
+# status directory holds state information kept between runs, create it if missing
+if not os.path.exists(statusDir):
+	os.makedirs(statusDir)
+if projectConfig.manifestDir != None and not os.path.exists(projectConfig.manifestDir):
+	os.makedirs(projectConfig.manifestDir)
+
+# ---- locks for concurrent runs ----
+
+# Concurrent runs (also on different hosts) coordinate via lease files in status/locks:
+# - the project lease is held while shared files are modified (moving files from the review directory,
+#   writing state files and the missing files log)
+# - a prefix lease is held by the run processing the files of this prefix in the dropbox directory,
+#   files not matching any prefix are processed by the holder of the lease 'unmatched'
+leaseDir = statusDir + "/locks"
+projectLease = LeaseLock(leaseDir, 'project', args.leaseTime)
+leases = dict() # key = lease name, value = LeaseLock object, or None if held by another run or other shard
+
+def releaseLeases():
+	"""Releases all leases held by this run, called at exit."""
+	for lease in leases.values():
+		if lease != None:
+			lease.release()
+	projectLease.release()
+
+atexit.register(releaseLeases)
+
+def acquireProjectLease():
+	"""Acquires the project lease, waits for concurrent runs to release it. Exits, if the lease cannot be acquired."""
+	if not projectLease.acquireWait(args.leaseTime):
+		printError("Project is locked by another run ({}).".format(projectLease.owner))
+		error_log('Critical', '', "Project is locked by another run ({}).".format(projectLease.owner))
+		exit(1)
+
+def holdsLease(name, inShard):
+	"""Returns True, if this run holds the lease with the given name, tries to acquire it on first use."""
+	if name not in leases:
+		leases[name] = None
+		if inShard:
+			lease = LeaseLock(leaseDir, name, args.leaseTime)
+			if lease.acquire():
+				leases[name] = lease
+			else:
+				print("Skipping files of '{}', locked by another run ({}).".format(name, lease.owner))
+	return leases[name] != None
+
+def renewLease(name):
+	"""Renews a lease held by this run (see LeaseLock.renew()). A lost lease (not renewed in time and
+	taken over by another run) is dropped with a warning, the remaining files are left for other runs.
+
+	Returns True, if this run still holds the lease.
+	"""
+	lease = leases.get(name)
+	if lease != None and not lease.renew():
+		printWarning("Lease '{}' was lost, remaining files are left for other runs.".format(lease.leaseFilePath))
+		leases[name] = None
+	return leases.get(name) != None
+
+def inShard(prefix):
+	"""Returns True, if the files of a prefix (None for files not matching any prefix) belong to the shard of this run."""
+	if prefix == None:
+		return shardIndex == 0
+	return zlib.crc32(prefix.encode('utf-8')) % shardCount == shardIndex
+
+# last samples of previously archived files, needed for continuity checks across file boundaries
+sampleState = SampleState(statusDir + "/samplestate")
+sampleState.read()
+projectConfig.sampleState = sampleState
+projectConfig.archiveDir = archiveDir
+
+# per-sensor statistics of archived files, written to one summary file per day
+dailyStats = DailyStats(statsDir)
+projectConfig.collectStats = not args.noStats
+
+# content fingerprints of archived files, used to detect duplicate and overlapping files (new and
+# modified archived files are hashed after the dropbox files were processed, see below);
+# the archive scan is also used for the missing files check
+archiveFiles = list(scanFiles(archiveDir))
+archivedPaths = set([relPath for relPath, fileSize, mtime in archiveFiles])
+fingerprintIndex = FingerprintIndex(statusDir + "/fingerprints")
+fingerprintIndex.read()
+fingerprintIndex.sync(archiveFiles)
+del archiveFiles
+# archived files are never modified by this script, modifications (e.g. manual edits or restores from
+# backup) are reported
+for relPath in fingerprintIndex.modifiedFiles:
+	printError("Archived file '{}' was modified (size or modification time changed).".format(relPath))
+	error_log('ArchiveModified', relPath, "Archived file was modified (size or modification time changed).")
+	retcode = 1
 
 # ---- transfer files from review directory to dropbox directory ----
 
 # directory structure is copied recursively
-# note, existing files in 'dropbox' cause script to abort
-copy(reviewDir, dropboxDir)
-	
+# note, files already existing in 'dropbox' are reported, differing files are kept in both
+#       directories and skipped until resolved manually
+acquireProjectLease()
+conflictingFiles = copy(reviewDir, dropboxDir)
+projectLease.release()
+if len(conflictingFiles) != 0:
+	retcode = 1
+
+# ---- bypass whole directories ----
+
+# directories whose files are all matched by a bypass rule are moved as a whole (one log entry per
+# directory), unless files in them are still being uploaded or conflict with files in the review directory
+# (then the files are processed individually below)
+bypassedFileCount = 0
+if len(projectConfig.bypassRules) != 0 and holdsLease('unmatched', inShard(None)):
+	scanTime = time.time()
+	for relDir in findBypassedDirectories(dropboxDir, projectConfig):
+		dirFiles = [(relDir + '/' + relPath, mtime) for relPath, fileSize, mtime in scanFiles(dropboxDir + '/' + relDir)]
+		if len(dirFiles) == 0:
+			continue
+		dirPaths = set([relPath for relPath, mtime in dirFiles])
+		if len(dirPaths & conflictingFiles) != 0:
+			continue
+		if any([uploadInProgress(relPath, mtime, dirPaths, args.uploadMarkers, args.settleTime, scanTime) != None
+		        for relPath, mtime in dirFiles]):
+			continue
+		print("Applying bypass rule to directory '{}' ({} files).".format(relDir, len(dirFiles)))
+		process_log('Bypassing', relDir + '/')
+		moveDirectory(dropboxDir, bypassDir, relDir)
+		bypassedFileCount = bypassedFileCount + len(dirFiles)
+
 # ---- check for new files in dropbox directory ----
 
-dropboxPathParts = dropboxDir.split('/') # split into path components
+# files that passed the file name based checks and need to be verified,
+# list of tuples (path relative to dropbox dir, expected file definition, file size, modification time)
+pendingFiles = []
+deferredFileCount = 0
+lockedFileCount = 0 # files skipped, since processed by other runs
+skippedPaths = set() # paths (without compression suffix) of deferred and locked files, left in dropbox
+dropboxFingerprints = dict() # key = fingerprint, value = path relative to dropbox dir
+dropboxFiles = list(scanFiles(dropboxDir))
+dropboxPaths = set([relPath for relPath, fileSize, mtime in dropboxFiles])
+scanTime = time.time()
+for newFilePath, fileSize, mtime in dropboxFiles:
+	if newFilePath in conflictingFiles:
+		continue # file with same name in review directory, skipped until resolved
+
+	# check, if we are expecting a file like this
+	matchingEf = None
+	for ef in projectConfig.expectedFiles:
+		#print("Testing  file '{}' against expected file '{}'".format(newFilePath, ef))
+		if newFilePath.find(ef) == 0:
+			matchingEf = projectConfig.expectedFiles[ef]
+			break
+	bypass = projectConfig.bypassRuleAppliesToFile(newFilePath)
+
+	# skip files processed by other runs (other shard or prefix locked by concurrent run)
+	if bypass or matchingEf == None:
+		owned = holdsLease('unmatched', inShard(None))
+	else:
+		owned = holdsLease(leaseName(matchingEf.prefix), inShard(matchingEf.prefix))
+	if not owned:
+		lockedFileCount = lockedFileCount + 1
+		skippedPaths.add(splitCompressionSuffix(newFilePath)[0])
+		continue
+
+	# pre-flight check: files still being uploaded are deferred without reading them, otherwise
+	# a partially written file would fail the checks and be moved to the review directory
+	reason = uploadInProgress(newFilePath, mtime, dropboxPaths, args.uploadMarkers, args.settleTime, scanTime)
+	if reason != None:
+		print("Deferring file '{}', upload in progress ({}).".format(newFilePath, reason))
+		deferredFileCount = deferredFileCount + 1
+		skippedPaths.add(splitCompressionSuffix(newFilePath)[0])
+		continue
+	nf = os.path.basename(newFilePath)
+	
+	# check, if file is in bypass list
+	if bypass:
+		print("Applying bypass rule to file '{}'.".format(newFilePath))
+		process_log('Bypassing', newFilePath)
+		moveFile(dropboxDir, bypassDir, newFilePath)
+		continue
+	
+	# compressed csv files are accepted as well
+	baseName, compression = splitCompressionSuffix(nf)
+	nameParts = os.path.splitext(baseName)
+	if len(nameParts) != 2 or (nameParts[1] != '.csv'):
+		printError("Unexpected file '{}' in dropbox folder.".format(newFilePath))
+		error_log('NotExpected', newFilePath, "Unexpected file in dropbox folder.")
+		moveFile(dropboxDir, reviewDir, newFilePath)
+		retcode = 1
+		continue
+	if not compressionSupported(compression):
+		printError("Cannot read compressed file '{}', python module 'zstandard' is missing.".format(newFilePath))
+		error_log('NotExpected', newFilePath, "Cannot read compressed file, python module 'zstandard' is missing.")
+		moveFile(dropboxDir, reviewDir, newFilePath)
+		retcode = 1
+		continue
+	
+	# must be a csv file of an expected prefix
+	if matchingEf == None:
+		printError("Unexpected file '{}' in dropbox folder.".format(newFilePath))
+		error_log('NotExpected', newFilePath, "Unexpected file in dropbox folder.")
+		moveFile(dropboxDir, reviewDir, newFilePath)
+		retcode = 1
+		continue
+	
+	# skip files of current day
+	# split filename at _
+	if isTodaysFile(nf):
+		continue # ignore file in dropbox
+
+	pendingFiles.append( (newFilePath, matchingEf, fileSize, mtime) )
+
+# ---- verify pending files ----
+
+scheduleFiles(pendingFiles, args.order)
+
+# in tiered mode only a sample of files per prefix gets the full data checks, all other files
+# only get the cheap entry checks (file name, size, header); sampled files are checked first
+# so that a failed sample can escalate the remaining files of the prefix to full checks
+sampledFiles = None # None means: full checks for all files
+escalatedPrefixes = set()
+if args.sampleFraction < 1:
+	sampledFiles = selectSampleFiles(pendingFiles, args.sampleFraction, args.sampleMode)
+	pendingFiles.sort(key=lambda pf: pf[0] not in sampledFiles) # stable sort keeps order otherwise
+	print("Tiered verification: full checks for {} of {} files.".format(len(sampledFiles), len(pendingFiles)))
 
 archivedFileCount = 0
-for root, dirs, files in os.walk(dropboxDir, topdown=False):
+entryCheckOnlyCount = 0
+verifiedFileCount = 0
+verifiedBytes = 0
+# read-ahead of the pending files, which are all read for the content fingerprint (and the content is
+# passed to the checks, except for large files checked in parallel chunks or incrementally)
+verifyPrefetcher = None
+prefetchStallTime = 0
+prefetchedFileCount = 0
+streamedFileCount = 0
+# memory of the read-ahead, optionally part of the memory budget of the whole run (which also holds
+# the memory claimed by the checks)
+memoryBudget = MemoryBudget(args.memoryBudget*1024*1024) if args.memoryBudget > 0 else None
+prefetchBudget = MemoryBudget(args.prefetchMemory*1024*1024, memoryBudget)
+projectConfig.memoryBudget = memoryBudget
+if args.prefetchMemory > 0:
+	# worker processes of the chunk checks are forked, which must happen before the read-ahead threads
+	# are started (a process forked while other threads hold locks may deadlock)
+	if projectConfig.parallelWorkers > 1:
+		projectConfig.chunkPoolAvailable()
+	prefetchFiles = [(newFilePath, fileSize) for newFilePath, matchingEf, fileSize, mtime in pendingFiles]
+	verifyPrefetcher = Prefetcher(dropboxDir, prefetchFiles, prefetchBudget, args.prefetchThreads)
+verifyStartTime = time.time()
+backlogFiles = [] # files left in dropbox for the next run, when the time budget is used up
+for i, (newFilePath, matchingEf, fileSize, mtime) in enumerate(pendingFiles):
+	# time budget: stop when used up, or when the next file is not expected to finish in time
+	# (estimated from throughput of files verified so far)
+	if args.maxRuntime > 0:
+		now = time.time()
+		expectedDuration = 0
+		if verifiedBytes > 0:
+			expectedDuration = fileSize*(now - verifyStartTime)/verifiedBytes
+		if now + expectedDuration - startTime > args.maxRuntime:
+			backlogFiles = pendingFiles[i:]
+			break
+	prefix = matchingEf.prefix
+	# renew leases regularly, a lost lease stops processing of the prefix
+	for name in list(leases):
+		renewLease(name)
+	if leases[leaseName(prefix)] == None:
+		lockedFileCount = lockedFileCount + 1
+		skippedPaths.add(splitCompressionSuffix(newFilePath)[0])
+		continue
+	fullCheck = sampledFiles == None or newFilePath in sampledFiles or prefix in escalatedPrefixes
 
-	rootStr = root.replace('\\', '/') # windows fix
-	pathParts = rootStr.split('/') # split into component
-	pathParts = pathParts[len(dropboxPathParts):] # keep only path parts below toplevel dir
+	# file modified since the dropbox scan (e.g. upload resumed after a stall): defer to next run
+	try:
+		st = os.stat(dropboxDir + '/' + newFilePath)
+		modified = st.st_size != fileSize or st.st_mtime != mtime
+	except OSError:
+		modified = True # file removed in the meantime
+	if modified:
+		print("Deferring file '{}', file was modified during this run.".format(newFilePath))
+		deferredFileCount = deferredFileCount + 1
+		skippedPaths.add(splitCompressionSuffix(newFilePath)[0])
+		continue
+	data = verifyPrefetcher.get(newFilePath) if verifyPrefetcher != None else None
+	if data != None and len(data) != fileSize:
+		data = None # file modified after it was read ahead
+	
+	# apply entry checks
+	verifiedFileCount = verifiedFileCount + 1
+	verifiedBytes = verifiedBytes + fileSize
+	passed = projectConfig.entryCheckPassedForFile(dropboxDir, newFilePath, matchingEf, fullCheck, fileSize, data)
 
-	# check for valid files
-	for nf in sorted(files):
-		# path relative to dropbox dir
-		if len(pathParts) == 0:
-			newFilePath = nf
-		else:
-			newFilePath = "/".join(pathParts) + "/" + nf
-		
-		# check, if file is in bypass list
-		if projectConfig.bypassRuleAppliesToFile(newFilePath):
-			print("Applying bypass rule to file '{}'.".format(newFilePath))
-			process_log('Bypassing', newFilePath)
-			# move file to bypass folder
-			# first create subdirectory, if not existing
-			targetDir = bypassDir + "/" + "/".join(pathParts)
-			if not os.path.exists(targetDir):
-				os.makedirs(targetDir)
-			shutil.move(dropboxDir + '/' + newFilePath, bypassDir + "/" + newFilePath)
-			continue
-		
-		nameParts = os.path.splitext(nf)
-		if len(nameParts) != 2 or (nameParts[1] != '.csv'):
-			printError("Unexpected file '{}' in dropbox folder.".format(newFilePath))
-			error_log('NotExpected', newFilePath, "Unexpected file in dropbox folder.")
-			# move file to review folder
-			# first create subdirectory, if not existing
-			targetDir = reviewDir + "/" + "/".join(pathParts)
-			if not os.path.exists(targetDir):
-				os.makedirs(targetDir)
-			shutil.move(dropboxDir + '/' + newFilePath, reviewDir + "/" + newFilePath)
-			retcode = 1
-			continue
-		
-		# must be a csv file
-		# check, if we are expecting a file like this
-		matchingEf = None
-		for ef in projectConfig.expectedFiles:
-			#print("Testing  file '{}' against expected file '{}'".format(newFilePath, ef))
-			if newFilePath.find(ef) == 0:
-				matchingEf = projectConfig.expectedFiles[ef]
-				break
-		
-		if matchingEf == None:
-			printError("Unexpected file '{}' in dropbox folder.".format(newFilePath))
-			error_log('NotExpected', newFilePath, "Unexpected file in dropbox folder.")
-			# move file to review folder
-			# first create subdirectory, if not existing
-			targetDir = reviewDir + "/" + "/".join(pathParts)
-			if not os.path.exists(targetDir):
-				os.makedirs(targetDir)
-			shutil.move(dropboxDir + '/' + newFilePath, reviewDir + "/" + newFilePath)
-			retcode = 1
-			continue
-		
-		# skip files of current day
-		# split filename at _
-		tokens = nf.split('_')
-		if len(tokens) == 3 and len(tokens[1])==10:
-			fileDate = datetime.datetime.strptime(tokens[1], '%Y-%m-%d')
-			todaysDate = datetime.datetime.today()
-			if fileDate.date() == todaysDate.date():
-				continue # ignore file in dropbox
-		
-		# apply entry checks
-		if not projectConfig.entryCheckPassedForFile(dropboxDir, newFilePath, matchingEf):
-			printError("Entry check failed for file '{}'.".format(newFilePath))
-			# move file to review folder
-			# first create subdirectory, if not existing
-			targetDir = reviewDir + "/" + "/".join(pathParts)
-			if not os.path.exists(targetDir):
-				os.makedirs(targetDir)
-			shutil.move(dropboxDir + '/' + newFilePath, reviewDir + "/" + newFilePath)
-			retcode = 1
-			continue
+	# check for files already in archive (same prefix and date, i.e. same time range) and for
+	# identical content under a different name; only files passing the entry checks are checked,
+	# files failing them are reported with their actual errors. The fingerprint is computed here and
+	# not in the dropbox scan, so that files left in the dropbox due to the time budget are not read.
+	duplicateCategory = None
+	fingerprint = None
+	if passed:
+		try:
+			fingerprint = fileFingerprint(dropboxDir + '/' + newFilePath, data)
+		except (IOError,) + DECOMPRESSION_ERRORS:
+			pass # file passed the checks, but cannot be read anymore: archived without fingerprint
+		archivedFile = fingerprintIndex.archivedFileWithName(newFilePath)
+		if archivedFile != None and fingerprintIndex.fingerprintOf(archivedFile) == None:
+			fingerprintIndex.hashFile(archiveDir, archivedFile) # not yet hashed
+		if archivedFile != None:
+			if fingerprintIndex.fingerprintOf(archivedFile) == fingerprint:
+				duplicateCategory = 'DuplicateFile'
+				msg = "File was already archived."
+			else:
+				duplicateCategory = 'OverlappingFile'
+				msg = "File with same name (prefix and date) but different content exists in archive as '{}'.".format(archivedFile)
+		elif fingerprint != None and fingerprintIndex.archivedFileWithFingerprint(fingerprint) != None:
+			duplicateCategory = 'DuplicateFile'
+			msg = "File is identical to archived file '{}'.".format(fingerprintIndex.archivedFileWithFingerprint(fingerprint))
+		elif fingerprint != None and fingerprint in dropboxFingerprints:
+			duplicateCategory = 'DuplicateFile'
+			msg = "File is identical to file '{}' in dropbox.".format(dropboxFingerprints[fingerprint])
 
+	# the check of a large file may take longer than the lease time: the file is only moved, if the
+	# lease was not lost in the meantime (otherwise another run processes the file as well)
+	if not renewLease(leaseName(prefix)):
+		lockedFileCount = lockedFileCount + 1
+		skippedPaths.add(splitCompressionSuffix(newFilePath)[0])
+		continue
+	if not passed:
+		printError("Entry check failed for file '{}'.".format(newFilePath))
+		moveFile(dropboxDir, reviewDir, newFilePath)
+		retcode = 1
+		if sampledFiles != None and newFilePath in sampledFiles and prefix not in escalatedPrefixes:
+			printWarning("Sampled file of prefix '{}' failed, all files with this prefix are fully checked.".format(prefix))
+			escalatedPrefixes.add(prefix)
+		continue
+	if duplicateCategory != None:
+		printError("{} : {}".format(newFilePath, msg))
+		error_log(duplicateCategory, newFilePath, msg)
+		moveFile(dropboxDir, reviewDir, newFilePath)
+		retcode = 1
+		continue
+	if fingerprint != None:
+		dropboxFingerprints[fingerprint] = newFilePath
+
+
+	# TODO : content checks
+
+	# all successful, move to archive
+	print("Archiving file '{}'.".format(newFilePath))
+	archivedFilePath, recompressed = archiveFile(dropboxDir, archiveDir, newFilePath, args.archiveCompression)
+	archivedFileCount = archivedFileCount + 1
+	if projectConfig.manifestDir != None and os.path.exists(projectConfig.manifestPath(newFilePath)):
+		os.remove(projectConfig.manifestPath(newFilePath)) # block results are only kept for files in review
+	if not fullCheck:
+		entryCheckOnlyCount = entryCheckOnlyCount + 1
+	process_log('Archiving', newFilePath)
+	if projectConfig.lastSample != None:
+		sampleState.update(*projectConfig.lastSample)
+	if projectConfig.lastStats != None:
+		dailyStats.add(*projectConfig.lastStats)
+	for msg in projectConfig.flagged:
+		process_log('Flagged', msg)
+	archivedPaths.add(archivedFilePath)
+	if recompressed and fingerprint != None:
+		# the fingerprint is computed from the uncompressed content, i.e. it is the same for the (re-)compressed archived file
+		archivedFileSize = os.path.getsize(archiveDir + '/' + archivedFilePath)
+		fingerprintIndex.add(archivedFilePath, archivedFileSize, os.path.getmtime(archiveDir + '/' + archivedFilePath),
+		                     fingerprint)
+	elif fingerprint != None:
+		fingerprintIndex.add(newFilePath, fileSize, mtime, fingerprint)
+
+verifyDuration = time.time() - verifyStartTime
+if verifyPrefetcher != None:
+	verifyPrefetcher.close()
+	prefetchStallTime = prefetchStallTime + verifyPrefetcher.stallTime
+	prefetchedFileCount = prefetchedFileCount + verifyPrefetcher.prefetchedFileCount
+	streamedFileCount = verifyPrefetcher.streamedFileCount
 
-		# TODO : content checks
+# block manifests of files removed from the review directory (instead of being corrected) are obsolete
+if projectConfig.manifestDir != None:
+	for f in os.listdir(projectConfig.manifestDir):
+		relPath = unquote(f)
+		if f[-4:] != '.tmp' and not os.path.exists(reviewDir + '/' + relPath) and not os.path.exists(dropboxDir + '/' + relPath):
+			os.remove(projectConfig.manifestDir + '/' + f)
+	projectConfig.manifestDir = None # archived files are always checked completely
 
-		# all successful, move to archive
-		print("Archiving file '{}'.".format(newFilePath))
-		archivedFileCount = archivedFileCount + 1
-		process_log('Archiving', newFilePath)
-		# move file to archive folder
-		# first create subdirectory, if not existing
-		targetDir = archiveDir + "/" + "/".join(pathParts)
-		if not os.path.exists(targetDir):
-			os.makedirs(targetDir)
-		shutil.move(dropboxDir + '/' + newFilePath, archiveDir + "/" + newFilePath)
+# ---- complete the fingerprint index ----
+
+# archived files not yet hashed (e.g. all files in the first run with an existing archive) are hashed
+# in slices, with limited read rate and within the time budget; until then, content duplicates of
+# these files under a different name are not detected
+hashedFileCount = 0
+unhashedPaths = fingerprintIndex.unhashedFiles()
+if len(unhashedPaths) != 0 and holdsLease('fingerprints', True):
+	indexThrottle = IoThrottle(args.scrubBandwidth*1024*1024)
+	for relPath in unhashedPaths[:args.indexSlice] if args.indexSlice > 0 else unhashedPaths:
+		if args.maxRuntime > 0 and time.time() - startTime > args.maxRuntime:
+			break
+		if fingerprintIndex.hashFile(archiveDir, relPath, indexThrottle.consume) != None:
+			hashedFileCount = hashedFileCount + 1
+
+# ---- scrub a slice of the archive ----
+
+# only one run scrubs at a time, the time budget is respected
+scrubbedFileCount = 0
+scrubFailedCount = 0
+if args.scrubSlice > 0 and len(backlogFiles) == 0 and holdsLease('scrub', True):
+	scrubState = ScrubState(statusDir + "/scrubstate")
+	scrubState.read()
+	throttle = IoThrottle(args.scrubBandwidth*1024*1024)
+	scrubPaths = sorted([p for p in archivedPaths if isDataFile(p)])
+	scrubSlice = scrubState.nextSlice(scrubPaths, args.scrubSlice)
+	if len(scrubSlice) == 0 and scrubState.lastPath != '':
+		# last scrubbed file was the last file of the archive (and was removed): start new pass
+		scrubState.passCompleted(datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+		scrubSlice = scrubState.nextSlice(scrubPaths, args.scrubSlice)
+	for relPath in scrubSlice:
+		if args.maxRuntime > 0 and time.time() - startTime > args.maxRuntime:
+			break
+		fullPath = archiveDir + '/' + relPath
+		passed = True
+		try:
+			fileSize = os.path.getsize(fullPath)
+			# checksum: fingerprint stored when the file was archived (or found modified, see above)
+			storedFingerprint = fingerprintIndex.fingerprintOf(relPath)
+			try:
+				fingerprint = throttledFingerprint(fullPath, throttle)
+			except DECOMPRESSION_ERRORS:
+				fingerprint = None # corrupt compressed file
+			if storedFingerprint != None and fingerprint != storedFingerprint:
+				printError("Archived file '{}' does not match its checksum.".format(relPath))
+				error_log('ScrubChecksumMismatch', relPath, "Archived file does not match its checksum.")
+				passed = False
+			elif storedFingerprint == None and fingerprint != None and relPath in fingerprintIndex.entries:
+				fingerprintIndex.add(relPath, *fingerprintIndex.entries[relPath][:2], fingerprint) # not yet hashed
+		except OSError:
+			passed = False # file removed in the meantime
+		if passed:
+			# current checks (continuity checks use the previous archived file)
+			matchingEf = None
+			for ef in projectConfig.expectedFiles:
+				if relPath.find(ef) == 0:
+					matchingEf = projectConfig.expectedFiles[ef]
+					break
+			if matchingEf != None:
+				passed = projectConfig.entryCheckPassedForFile(archiveDir, relPath, matchingEf, True, fileSize)
+				throttle.consume(fileSize)
+				if not passed:
+					printError("Archived file '{}' fails the current checks.".format(relPath))
+					error_log('ScrubFailed', relPath, "Archived file fails the current checks.")
+		scrubbedFileCount = scrubbedFileCount + 1
+		if not passed:
+			scrubFailedCount = scrubFailedCount + 1
+			retcode = 1
+		scrubState.fileScrubbed(relPath, passed, datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+		if relPath == scrubPaths[-1]:
+			scrubState.passCompleted(datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+	scrubState.write()
 
+projectConfig.closeChunkPool()
+# state files are merged with changes of concurrent runs while holding the project lease
+acquireProjectLease()
+sampleState.write()
+fingerprintIndex.write()
+dailyStats.write()
+# files archived by concurrent runs are known from the merged fingerprint index
+archivedPaths.update(fingerprintIndex.entries)
 
 # ---- check for missing files ----
 
@@ -367,31 +1125,18 @@ if retcode != 0:
 		print(fobj.read())
 		del fobj
 
-retCodeMissingFiles, missingFileCount = checkForMissingFiles(archiveDir, reviewDir, projectConfig)
+# files left in dropbox (time budget, deferred or processed by other runs) are not missing
+backlogPaths = set([splitCompressionSuffix(pf[0])[0] for pf in backlogFiles]) | skippedPaths
+retCodeMissingFiles, missingFileCount = checkForMissingFiles(archiveDir, reviewDir, projectConfig, archivedPaths, backlogPaths)
+# remember time of check for the idle run test
+with open(missingCheckStampFile, 'w') as fobj:
+	fobj.write(Logger.TIME_STAMP + "\n")
 if retCodeMissingFiles == 1:
 	retcode = retCodeMissingFiles
 	# print list of missing files as error to log
-	print("\nList of missing files:")
-	if os.path.exists(logDir + "/missing"):
-		fobj = open(logDir + "/missing")
-		print(fobj.read())
-		del fobj
-	
-
-print("\nRemaining files in review directory:")
-
-# if review directory is not empty, print list of open files
-revFileCount = 0
-for root, dirs, files in os.walk(reviewDir, topdown=False):
-	rootStr = root.replace('\\', '/') # windows fix
-	pathParts = rootStr.split('/') # split into component
-	pathParts = pathParts[len(dropboxPathParts):] # keep only path parts below toplevel dir
-	for f in files:
-		relFile = "/".join(pathParts) + "/" + f
-		print(relFile)
-		revFileCount = revFileCount + 1
+	printMissingFiles(logDir)
 
-print("")
+revFileCount = printRemainingFiles(reviewDir)
 
 if revFileCount != 0:
 	print("There are {} files remaining in the review directory.".format(revFileCount))
@@ -403,7 +1148,39 @@ if missingFileCount != 0:
 
 if archivedFileCount != 0:
 	print("{} files were successfully archived.".format(archivedFileCount))
+	if entryCheckOnlyCount != 0:
+		print("{} of these files were archived after entry checks only (tiered verification).".format(entryCheckOnlyCount))
 	retcode = 1
+if verifiedFileCount != 0:
+	print("{} files ({:.1f} MB) verified in {:.1f} s ({:.1f} files/s, {:.2f} MB/s).".format(verifiedFileCount,
+	      verifiedBytes/1024/1024, verifyDuration, verifiedFileCount/max(verifyDuration, 0.001),
+	      verifiedBytes/1024/1024/max(verifyDuration, 0.001)))
+if len(backlogFiles) != 0:
+	print("Time budget used up, {} files ({:.1f} MB) are left in the dropbox directory for the next run.".format(
+	      len(backlogFiles), sum([pf[2] for pf in backlogFiles])/1024/1024))
+if projectConfig.reusedBytes != 0:
+	print("{:.1f} MB of unchanged data in corrected files were not checked again.".format(projectConfig.reusedBytes/1024/1024))
+if args.prefetchMemory > 0:
+	print("{} files read ahead, waited {:.1f} s for reads and {:.1f} s for memory (peak {:.1f} MB).".format(prefetchedFileCount,
+	      prefetchStallTime, prefetchBudget.waitTime, prefetchBudget.peak/1024/1024))
+	if streamedFileCount != 0:
+		print("{} large files were checked in streaming mode.".format(streamedFileCount))
+	if memoryBudget != None:
+		print("Memory budget: peak {:.1f} MB, read-ahead waited {:.1f} s for memory held by the checks.".format(
+		      memoryBudget.peak/1024/1024, memoryBudget.waitTime))
+if bypassedFileCount != 0:
+	print("{} files were bypassed as whole directories.".format(bypassedFileCount))
+if hashedFileCount != 0:
+	print("{} archived files added to the fingerprint index, {} remaining (throttled for {:.1f} s).".format(hashedFileCount,
+	      len(fingerprintIndex.unhashedFiles()), indexThrottle.sleepTime))
+if scrubbedFileCount != 0:
+	print("{} archived files scrubbed, {} failed (throttled for {:.1f} s).".format(scrubbedFileCount, scrubFailedCount, throttle.sleepTime))
+if lockedFileCount != 0:
+	print("{} files were skipped, since they are processed by other runs.".format(lockedFileCount))
+if deferredFileCount != 0:
+	print("{} files were deferred to a later run (upload in progress).".format(deferredFileCount))
+if len(escalatedPrefixes) != 0:
+	print("Full checks were done for all files of {} prefixes due to failed samples.".format(len(escalatedPrefixes)))
 
 # return signaling caller the result: 0 = success, 1 = have error(s)
 exit(retcode)
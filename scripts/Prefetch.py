@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class Prefetcher, which reads files ahead on background threads.
+
+On network file systems, each file open and read is a round-trip to the server. When many small
+files are processed one after another, the processing waits for the file system most of the time.
+The Prefetcher reads the content of the next files (in the order they are processed) into memory
+in parallel, while the current file is processed.
+"""
+
+import threading
+import time
+
+
+class Prefetcher:
+	"""Reads files ahead into memory on background threads.
+
+	Files are read in the given order, the memory of files read but not yet processed is reserved in
+	a memory budget (see MemoryBudget.py): reading ahead pauses while the budget is used up. Files are
+	consumed with get() in the same order, the memory of a file is held until the next file is
+	requested. Files skipped by the consumer are dropped (or not read at all).
+
+	Arguments
+	---------
+	topDir
+	    Directory, the file paths are relative to
+	files
+	    List of tuples (relPath, fileSize) in the order the files are consumed. Files larger than
+	    the streaming size of the budget are not read ahead (streaming mode).
+	budget
+	    MemoryBudget object
+	threadCount
+	    Number of reader threads
+	"""
+	def __init__(self, topDir, files, budget, threadCount):
+		self.topDir = topDir
+		self.files = [(relPath, fileSize) for relPath, fileSize in files if fileSize <= budget.streamingSize]
+		self.streamedFileCount = len(files) - len(self.files) # files too large to be read ahead
+		self.indexOf = dict() # key = path relative to topDir, value = index in self.files
+		for i, (relPath, fileSize) in enumerate(self.files):
+			self.indexOf[relPath] = i
+		self.budget = budget
+		self.condition = threading.Condition()
+		# memory is reserved in file order, otherwise files read later could use up the budget while
+		# the consumer waits for the next file
+		self.reserveLock = threading.Lock()
+		self.nextIndex = 0 # next file to be read by a reader thread
+		self.position = 0 # files before this index are no longer needed by the consumer
+		self.buffers = dict() # key = index, value = file content (None if file could not be read)
+		self.heldSize = 0 # memory of the file currently processed by the consumer
+		self.closed = False
+		self.stallTime = 0 # total time the consumer waited for files, in seconds
+		self.prefetchedFileCount = 0 # files consumed from memory
+		self.threads = []
+		for i in range(min(threadCount, len(self.files))):
+			t = threading.Thread(target=self.readFiles, daemon=True)
+			t.start()
+			self.threads.append(t)
+
+	def readFiles(self):
+		"""Reader thread: reads files in order, as long as memory is available."""
+		while True:
+			with self.reserveLock:
+				with self.condition:
+					if self.nextIndex < self.position:
+						self.nextIndex = self.position # skipped by consumer
+					if self.closed or self.nextIndex >= len(self.files):
+						return
+					index = self.nextIndex
+					self.nextIndex = self.nextIndex + 1
+				fileSize = self.files[index][1]
+				# backpressure: wait for memory, unless the file is no longer needed
+				if not self.budget.reserve(fileSize, lambda: self.closed or index < self.position):
+					continue
+			try:
+				with open(self.topDir + '/' + self.files[index][0], 'rb') as f:
+					data = f.read()
+			except OSError:
+				data = None # consumer reads the file itself and reports the error
+			with self.condition:
+				if index < self.position or self.closed:
+					self.budget.release(fileSize)
+				else:
+					self.buffers[index] = data
+				self.condition.notify_all()
+
+	def get(self, relPath):
+		"""Returns content of a file, waits until it has been read. The memory of the previously returned
+		file is released, files before this file (in the order given in the constructor) that were not
+		consumed are dropped.
+
+		Returns None, if the file is not read ahead (not in the list, too large or unreadable), the
+		consumer then reads the file itself.
+		"""
+		index = self.indexOf.get(relPath)
+		with self.condition:
+			self.releaseHeld()
+			if index == None or self.closed or index < self.position:
+				return None
+			self.dropBuffers(index)
+			self.budget.wake() # reader threads waiting for memory of skipped files
+			if index not in self.buffers:
+				stallStart = time.time()
+				while index not in self.buffers:
+					self.condition.wait()
+				self.stallTime = self.stallTime + time.time() - stallStart
+			data = self.buffers.pop(index)
+			self.heldSize = self.files[index][1]
+			self.position = index + 1
+		if data != None:
+			self.prefetchedFileCount = self.prefetchedFileCount + 1
+		return data
+
+	def releaseHeld(self):
+		"""Releases the memory of the file processed by the consumer, must be called with self.condition held."""
+		if self.heldSize != 0:
+			self.budget.release(self.heldSize)
+			self.heldSize = 0
+
+	def dropBuffers(self, position):
+		"""Drops the files before the given index, must be called with self.condition held."""
+		self.position = position
+		for index in [i for i in self.buffers if i < position]:
+			del self.buffers[index]
+			self.budget.release(self.files[index][1])
+
+	def close(self):
+		"""Stops the reader threads, drops all files not yet consumed and releases their memory."""
+		with self.condition:
+			self.closed = True
+			self.releaseHeld()
+			self.dropBuffers(len(self.files))
+			self.condition.notify_all()
+		self.budget.wake()
+		for t in self.threads:
+			t.join()
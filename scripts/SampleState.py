@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the class SampleState that keeps the last sample of each expected file prefix
+across runs, so that checks can be continued across file (day) boundaries.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from print_funcs import *
+
+TIME_STAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+class SampleState:
+	"""Persistent store for the last archived sample of each expected file prefix.
+
+	The state is kept in a small json file (usually 'status/samplestate') with one
+	entry per file prefix, holding the time stamp and the values of the last data line.
+	"""
+	def __init__(self, stateFilePath):
+		self.stateFilePath = stateFilePath
+		self.lastSamples = dict() # key = file prefix, value = tuple (time stamp, list of value strings)
+		self.modified = False
+
+	def read(self):
+		"""Reads state file, if existing. A corrupt state file is ignored (with warning), since
+		the state only affects the continuity checks of the next file.
+		"""
+		self.lastSamples = dict()
+		self.modified = False
+		if not os.path.exists(self.stateFilePath):
+			return
+		try:
+			with open(self.stateFilePath, 'r') as f:
+				data = json.load(f)
+			for prefix in data:
+				ts = datetime.strptime(data[prefix][0], TIME_STAMP_FORMAT)
+				self.lastSamples[prefix] = (ts, data[prefix][1])
+		except (ValueError, IndexError, TypeError, IOError) as e:
+			printWarning("Cannot read sample state file '{}', continuity checks are skipped for this run.".format(self.stateFilePath))
+			self.lastSamples = dict()
+
+	def write(self):
+		"""Writes state file, but only if it was modified in this run.
+
+		Samples stored in the meantime by concurrent runs (for other prefixes) are merged, i.e. the
+		state file is read again and for each prefix the newest sample is kept.
+		"""
+		if not self.modified:
+			return
+		lastSamples = self.lastSamples
+		self.read()
+		for prefix in lastSamples:
+			self.update(prefix, *lastSamples[prefix])
+		data = dict()
+		for prefix in self.lastSamples:
+			ts, values = self.lastSamples[prefix]
+			data[prefix] = [ts.strftime(TIME_STAMP_FORMAT), values]
+		# write to temporary file first and rename afterwards, so that an interrupted run
+		# does not leave a truncated state file behind
+		with open(self.stateFilePath + ".tmp", 'w') as f:
+			json.dump(data, f, sort_keys=True)
+		os.rename(self.stateFilePath + ".tmp", self.stateFilePath)
+		self.modified = False
+
+	def lastSample(self, prefix):
+		"""Returns tuple (time stamp, values) of the last sample stored for the given file prefix,
+		or None if nothing is known about this prefix yet.
+		"""
+		return self.lastSamples.get(prefix)
+
+	def update(self, prefix, timeStamp, values):
+		"""Stores the last sample of an archived file.
+
+		Samples older than the currently stored one are ignored, so that late arriving files
+		(e.g. corrected files from the review directory) do not reset the state.
+		"""
+		if prefix in self.lastSamples and self.lastSamples[prefix][0] >= timeStamp:
+			return
+		self.lastSamples[prefix] = (timeStamp, values)
+		self.modified = True
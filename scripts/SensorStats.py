@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the classes for per-sensor statistics collected during verification:
+
+- SensorStats : running aggregates for the columns of a single file
+- DailyStats  : per-day summary files (usually in directory 'stats' next to the archive)
+"""
+
+import json
+import math
+import os
+
+from print_funcs import *
+
+# cell values treated as missing value
+MISSING_VALUES = ('', '-')
+
+
+class SensorStats:
+	"""Running aggregates (count, missing count, min, max, mean, variance) for each SensorID column.
+
+	Mean and variance are computed with Welford's online algorithm, so that the values of a file
+	are processed in a single pass and without keeping them in memory.
+	"""
+	def __init__(self, sensorTokens):
+		# only columns with a SensorID are evaluated, first column holds the time stamp
+		self.columns = [i for i in range(1, len(sensorTokens)) if sensorTokens[i].strip() != '']
+		self.names = [sensorTokens[i].strip() for i in self.columns]
+		n = len(self.columns)
+		self.count = [0]*n
+		self.missing = [0]*n
+		self.minimum = [math.inf]*n
+		self.maximum = [-math.inf]*n
+		self.mean = [0.0]*n
+		self.m2 = [0.0]*n # sum of squared differences from the mean
+
+	def addSample(self, tokens):
+		"""Adds the values of a data line (list of tokens, including the time stamp column).
+
+		Empty cells and the placeholder '-' count as missing values, other non-numeric values
+		(e.g. logger names and group markers) are ignored.
+		"""
+		count = self.count
+		mean = self.mean
+		for j, i in enumerate(self.columns):
+			token = tokens[i]
+			if token in MISSING_VALUES:
+				self.missing[j] += 1
+				continue
+			try:
+				x = float(token)
+			except ValueError:
+				continue
+			n = count[j] + 1
+			count[j] = n
+			delta = x - mean[j]
+			mean[j] += delta/n
+			self.m2[j] += delta*(x - mean[j])
+			if x < self.minimum[j]:
+				self.minimum[j] = x
+			if x > self.maximum[j]:
+				self.maximum[j] = x
+
+	def merge(self, other):
+		"""Merges the aggregates of another SensorStats object (for the same columns), e.g. computed
+		for another chunk of the same file. Mean and variance are combined with the parallel variant
+		of Welford's algorithm (Chan et al.).
+		"""
+		for j in range(len(self.columns)):
+			n1 = self.count[j]
+			n2 = other.count[j]
+			self.missing[j] += other.missing[j]
+			if n2 == 0:
+				continue
+			n = n1 + n2
+			delta = other.mean[j] - self.mean[j]
+			self.mean[j] += delta*n2/n
+			self.m2[j] += other.m2[j] + delta*delta*n1*n2/n
+			self.count[j] = n
+			self.minimum[j] = min(self.minimum[j], other.minimum[j])
+			self.maximum[j] = max(self.maximum[j], other.maximum[j])
+
+	def missingRatios(self):
+		"""Returns list of tuples (SensorID, missing count, value count incl. missing) for all
+		sensors that have values or missing values.
+		"""
+		return [(self.names[j], self.missing[j], self.count[j] + self.missing[j])
+		        for j in range(len(self.columns)) if self.count[j] + self.missing[j] != 0]
+
+	def summary(self):
+		"""Returns dictionary with the aggregates of all sensors that have values or missing values.
+
+		Key is the SensorID, value is a dictionary with keys Count, Missing, Min, Max, Mean and Variance
+		(population variance). Min, Max, Mean and Variance are None for sensors without values.
+		"""
+		res = dict()
+		for j in range(len(self.columns)):
+			n = self.count[j]
+			if n == 0 and self.missing[j] == 0:
+				continue # text column, e.g. logger name
+			s = dict()
+			s["Count"] = n
+			s["Missing"] = self.missing[j]
+			s["Min"] = self.minimum[j] if n != 0 else None
+			s["Max"] = self.maximum[j] if n != 0 else None
+			s["Mean"] = self.mean[j] if n != 0 else None
+			s["Variance"] = self.m2[j]/n if n != 0 else None
+			# SensorIDs are not unique in all files, append column index for repeated IDs
+			name = self.names[j]
+			if name in res:
+				name = "{}#{}".format(name, self.columns[j])
+			res[name] = s
+		return res
+
+
+class DailyStats:
+	"""Collects the sensor statistics of archived files and writes them to one summary file per day.
+
+	The summary file 'YYYY-MM-DD.json' contains one entry per file prefix, with the statistics of
+	each sensor as returned by SensorStats.summary(). Existing summary files are updated, i.e. the
+	entries of files archived in a later run are added.
+	"""
+	def __init__(self, statsDir):
+		self.statsDir = statsDir
+		self.days = dict() # key = day string 'YYYY-MM-DD', value = dict (key = file prefix, value = summary)
+
+	def add(self, prefix, dayString, summary):
+		"""Adds the statistics summary of an archived file."""
+		self.days.setdefault(dayString, dict())[prefix] = summary
+
+	def write(self):
+		"""Writes/updates the summary files of all days with new statistics."""
+		if len(self.days) == 0:
+			return
+		if not os.path.exists(self.statsDir):
+			os.makedirs(self.statsDir)
+		for dayString in self.days:
+			statsFilePath = self.statsDir + '/' + dayString + '.json'
+			data = dict()
+			if os.path.exists(statsFilePath):
+				try:
+					with open(statsFilePath, 'r') as f:
+						data = json.load(f)
+				except (ValueError, IOError) as e:
+					printWarning("Cannot read statistics file '{}', file is recreated.".format(statsFilePath))
+					data = dict()
+			data.update(self.days[dayString])
+			with open(statsFilePath + ".tmp", 'w') as f:
+				json.dump(data, f, sort_keys=True, separators=(',', ':'))
+			os.rename(statsFilePath + ".tmp", statsFilePath)
+		self.days = dict()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+File contains the check pipelines for the test groups used in the .exp file.
+
+Each test group is a TestGroup object registered in TEST_GROUPS. The object declares how much
+of a data file must be read for its checks (readLevel), so that a file is only read as far as
+needed, and implements the individual checks.
+
+To add a new test group, derive a class from TestGroup (or one of the existing groups),
+override the attributes/check functions as needed and register an instance with registerTestGroup().
+"""
+
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+# read levels, i.e. how much of a file is read for the checks of a test group
+READ_NONE = 0    # file content is not read at all
+READ_HEADER = 1  # only header section (up to first empty line) is read
+READ_STATS = 2   # data section lines are counted, but not parsed
+READ_FULL = 3    # data section is parsed line by line
+
+# file size checks
+SIZE_NONE = 0    # no file size check
+SIZE_EXACT = 1   # file size must match expected size exactly (ef.fileSize)
+SIZE_RANGE = 2   # file size must be within range ef.fileSize..ef.fileSizeMax
+
+TIME_STAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# memory of event data held by the checks, claimed in the memory budget of the run in steps of EVENTS_PER_CLAIM events
+EVENTS_PER_CLAIM = 65536
+EVENT_BYTES = 16 # time stamp and line hash arrays
+EVENT_SORT_BYTES = 150 # temporary list of (time stamp, hash) tuples when sorting
+EPOCH = datetime(1970, 1, 1) # reference time for time stamps stored as seconds
+
+
+class FileCheck:
+	"""Data of the check of a single file, passed to the check functions of a TestGroup.
+
+	Check functions report errors via error() and store their results (sample count, last sample)
+	in this object.
+	"""
+	def __init__(self, configFiles, fname, ef):
+		self.configFiles = configFiles
+		self.fname = fname # file path relative to dropbox dir
+		self.ef = ef # expected file definition
+		self.sensorTokens = [] # tokens of SensorID header line
+		self.prevSample = None # tuple (time stamp, values) of last sample of previous file, for continuity check
+		self.sampleCount = 0
+		self.lastSample = None # tuple (time stamp, values) of last valid sample in file
+		self.stats = None # optional SensorStats object, receives the values of all valid data lines
+
+	def error(self, category, message):
+		"""Reports an error. Returns True, if checking of the file shall stop."""
+		return self.configFiles.reportFileError(category, self.fname, message)
+
+	def countSuppressedErrors(self, category, count):
+		"""Adds errors that were found, but not reported (beyond the per-category limit)."""
+		self.configFiles.fileErrors[category] = self.configFiles.fileErrors.get(category, 0) + count
+
+
+class TestGroup:
+	"""Base class for test group check pipelines.
+
+	The default implementation performs the checks for regular time series data:
+	file size range, column count, time stamp format, sampling interval and sample count.
+	"""
+	name = None
+	readLevel = READ_FULL
+	sizeCheck = SIZE_RANGE
+	sampleCountCheck = True
+	chunkable = True # data section of large files may be checked in parallel chunks (see ChunkCheck.py)
+
+	def checkFileSize(self, ef, fileSize):
+		"""Returns an error message, if the file size does not match the expected size, otherwise None."""
+		expFileSize = ef.fileSize
+		if self.sizeCheck == SIZE_EXACT:
+			if expFileSize != 0 and expFileSize != fileSize:
+				return "Mismatching file size, expected {} bytes, got {} bytes.".format(expFileSize, fileSize)
+		elif self.sizeCheck == SIZE_RANGE:
+			expFileSizeMin = expFileSize # min and exact size are defined by the same parameter
+			expFileSizeMax = ef.fileSizeMax
+			if (expFileSizeMax != 0 and fileSize > expFileSizeMax) or (expFileSizeMin != 0 and fileSize < expFileSizeMin):
+				return ("File size {} bytes is not in expected size range [{}..{}] bytes."
+				        .format(fileSize, expFileSizeMin, expFileSizeMax))
+		return None
+
+	def checkSampleCount(self, ef, sampleCount):
+		"""Returns an error message, if the number of samples does not match the expected count, otherwise None."""
+		if not self.sampleCountCheck:
+			return None
+		expLineCount = ef.sampleCount
+		if expLineCount != 0:
+			if sampleCount < ef.sampleCountMin or sampleCount > ef.sampleCountMax:
+				return "Expected {} samples, got {}.".format(expLineCount, sampleCount)
+		return None
+
+	def intervalErrorMessage(self, ef, timeDiffSec, timeStampString):
+		"""Returns the error message for a sampling interval outside the expected range."""
+		if ef.intervalTol == 0:
+			return ("Sampling interval before time stamp '{}' was {} s, but expected was {} s"
+			        .format(timeStampString, timeDiffSec, ef.interval))
+		return ("Sampling interval before time stamp '{}' was {} s, but was expected in range [{},{}] s"
+		        .format(timeStampString, timeDiffSec, ef.intervalMin, ef.intervalMax))
+
+	def checkPreviousFileInterval(self, ef, prevTimeStamp, ts, timeStampString):
+		"""Checks the sampling interval between the last sample of the previous file and the first
+		sample of a file. Returns an error message, if the interval is outside the expected range, otherwise None.
+		"""
+		minIntervalLength = ef.intervalMin
+		maxIntervalLength = ef.intervalMax
+		timeDiffSec = (ts-prevTimeStamp).total_seconds()
+		if timeDiffSec < minIntervalLength or timeDiffSec > maxIntervalLength:
+			return ("Sampling interval between last sample '{}' of previous file and first time stamp '{}' was {} s, but was expected in range [{},{}] s"
+			        .format(prevTimeStamp, timeStampString, timeDiffSec, minIntervalLength, maxIntervalLength))
+		return None
+
+	def checkDataSection(self, check, lines):
+		"""Checks the data section of a file (only called for readLevel READ_FULL).
+
+		Arguments
+		---------
+		check
+		    FileCheck object of the file, receives sample count, last sample and sensor statistics
+		lines
+		    Iterable over the data section lines (without line endings)
+
+		Returns False, if checking of the file shall stop due to an error.
+		"""
+		ef = check.ef
+		fname = check.fname
+		columnCount = len(check.sensorTokens)
+		prevSample = check.prevSample
+		stats = check.stats
+		# if we have a sample interval given, the interval test is enabled
+		intervalCheck = ef.interval > 0
+		minIntervalLength = ef.intervalMin
+		maxIntervalLength = ef.intervalMax
+
+		# read data section, extract samples and compute time difference between samples
+		sampleCount = 0
+		lastTimeStamp = None
+		lastTokens = None
+		for line in lines:
+			tokens = line.split(',')
+			sampleCount = sampleCount + 1
+			if len(tokens) != columnCount:
+				if check.error('ColumnCountMismatch', "Data section in file '{}' contains line '{}' with mismatching column count (expected {}, got {} columns)"
+				               .format(fname, line, columnCount, len(tokens))):
+					return False
+				# skip the line in time stamp and interval checks; the
+				# interval check restarts with the next valid line to avoid consequential errors
+				lastTimeStamp = None
+				prevSample = None
+				continue
+			# now parse time stamp
+			try:
+				ts = datetime.strptime(tokens[0], TIME_STAMP_FORMAT)
+			except ValueError:
+				if check.error('InvalidTimeStamp', "Data section in file '{}' contains invalid time stamp format '{}'"
+				               .format(fname, tokens[0])):
+					return False
+				lastTimeStamp = None
+				prevSample = None
+				continue
+
+			if lastTimeStamp == None and prevSample != None and prevSample[0] < ts:
+				msg = self.checkPreviousFileInterval(ef, prevSample[0], ts, tokens[0])
+				if msg != None and check.error('InvalidSamplingInterval', msg):
+					return False
+
+			if lastTimeStamp != None and intervalCheck:
+				timeDiffSec = (ts-lastTimeStamp).total_seconds()
+				# if we have a toleranz > 0, compare with toleranz band
+				if timeDiffSec < minIntervalLength or timeDiffSec > maxIntervalLength:
+					if check.error('InvalidSamplingInterval', self.intervalErrorMessage(ef, timeDiffSec, tokens[0])):
+						return False
+			lastTimeStamp = ts
+			lastTokens = tokens
+			if stats != None:
+				stats.addSample(tokens)
+
+		check.sampleCount = sampleCount
+		if lastTimeStamp != None:
+			check.lastSample = (lastTimeStamp, lastTokens[1:])
+		return True
+
+
+class TimeSeriesGroup(TestGroup):
+	"""Regular time series data (IBK_TimeSeries)."""
+	name = 'IBK_TimeSeries'
+
+
+class DHT22Group(TestGroup):
+	name = 'IBK_Mon_DHT22'
+
+
+class ConComGroup(TestGroup):
+	name = 'IBK_Mon_conCom'
+
+
+class OneWireGroup(TestGroup):
+	"""1-Wire loggers write files of fixed size (support level 1), hence the exact file size check."""
+	name = 'IBK_Mon_1Wire'
+	sizeCheck = SIZE_EXACT
+
+
+class WinStatGroup(TestGroup):
+	"""Weather station data, file size and sample count vary, only format and intervals are checked."""
+	name = 'IBK_Mon_WinStat'
+	sizeCheck = SIZE_NONE
+	sampleCountCheck = False
+
+
+class EventDataGroup(TestGroup):
+	"""Event data with irregular time stamps.
+
+	Instead of the sampling interval check, event streams are checked for out-of-order and
+	duplicate events, and for bursts. The burst check is configured per file prefix in the
+	optional 'EventBursts' object of the exp file:
+
+	- ef.burstWindow    : length of burst window in seconds (0 disables burst check)
+	- ef.burstMaxEvents : max. number of events allowed within any burst window
+	"""
+	name = 'IBK_EventData'
+	sizeCheck = SIZE_NONE
+	sampleCountCheck = False
+	chunkable = False # duplicate and burst checks need all events of the file
+
+	def checkDataSection(self, check, lines):
+		"""Checks the data section of an event data file.
+
+		Lines are processed in a streaming manner, only the time stamps (as seconds) and a hash
+		of each line are kept in compact arrays. Time stamps are sorted afterwards (only if
+		out-of-order events were found) to detect duplicate events and compute the event rates
+		over a sliding window. The memory of the arrays is claimed in the memory budget of the run
+		(if any), so that the read-ahead pauses meanwhile.
+
+		Returns False, if checking of the file shall stop due to an error.
+		"""
+		claimed = [0] # bytes claimed in the memory budget
+		try:
+			return self.checkEvents(check, lines, claimed)
+		finally:
+			if claimed[0] != 0:
+				check.configFiles.memoryBudget.release(claimed[0])
+
+	def checkEvents(self, check, lines, claimed):
+		"""Implementation of checkDataSection(), claimed[0] holds the bytes claimed in the memory budget."""
+		ef = check.ef
+		budget = check.configFiles.memoryBudget
+		fname = check.fname
+		columnCount = len(check.sensorTokens)
+		timeStamps = array('d') # time stamps in seconds since epoch
+		lineHashes = array('q') # hashes of event lines, to distinguish duplicates from simultaneous events
+		lastTime = None
+		lastTokens = None
+		sampleCount = 0
+		claimedEvents = 0 if budget != None else sys.maxsize
+		for line in lines:
+			tokens = line.split(',')
+			sampleCount = sampleCount + 1
+			if len(tokens) != columnCount:
+				if check.error('ColumnCountMismatch', "Data section in file '{}' contains line '{}' with mismatching column count (expected {}, got {} columns)"
+				               .format(fname, line, columnCount, len(tokens))):
+					return False
+				continue
+			try:
+				t = (datetime.strptime(tokens[0], TIME_STAMP_FORMAT) - EPOCH).total_seconds()
+			except ValueError:
+				if check.error('InvalidTimeStamp', "Data section in file '{}' contains invalid time stamp format '{}'"
+				               .format(fname, tokens[0])):
+					return False
+				continue
+			if lastTime != None and t < lastTime:
+				if check.error('UnsortedTimeStamps', "Event at time stamp '{}' is earlier than previous event at '{}'"
+				               .format(tokens[0], EPOCH + timedelta(seconds=lastTime))):
+					return False
+			timeStamps.append(t)
+			lineHashes.append(hash(line))
+			if len(timeStamps) > claimedEvents:
+				budget.claim(EVENTS_PER_CLAIM*EVENT_BYTES)
+				claimed[0] = claimed[0] + EVENTS_PER_CLAIM*EVENT_BYTES
+				claimedEvents = claimedEvents + EVENTS_PER_CLAIM
+			lastTime = t
+			lastTokens = tokens
+			if check.stats != None:
+				check.stats.addSample(tokens)
+		check.sampleCount = sampleCount
+		if lastTime != None:
+			check.lastSample = (EPOCH + timedelta(seconds=lastTime), lastTokens[1:])
+
+		# sort events (only needed if out-of-order events were found, sorted input is the common case)
+		if not all(timeStamps[i] <= timeStamps[i+1] for i in range(len(timeStamps)-1)):
+			sortBytes = len(timeStamps)*EVENT_SORT_BYTES if budget != None else 0
+			if sortBytes != 0:
+				budget.claim(sortBytes)
+				claimed[0] = claimed[0] + sortBytes
+			events = sorted(zip(timeStamps, lineHashes))
+			timeStamps = array('d', [e[0] for e in events])
+			lineHashes = array('q', [e[1] for e in events])
+			del events
+			if sortBytes != 0:
+				budget.release(sortBytes)
+				claimed[0] = claimed[0] - sortBytes
+
+		# duplicate events: same time stamp and same line content
+		i = 0
+		while i < len(timeStamps):
+			j = i + 1
+			while j < len(timeStamps) and timeStamps[j] == timeStamps[i]:
+				j = j + 1
+			if j - i > 1:
+				duplicates = (j - i) - len(set(lineHashes[i:j]))
+				if duplicates > 0:
+					if check.error('DuplicateEvent', "Event at time stamp '{}' is contained {} times in file"
+					               .format(EPOCH + timedelta(seconds=timeStamps[i]), duplicates+1)):
+						return False
+			i = j
+
+		# burst statistics: max. number of events within a sliding window of ef.burstWindow seconds
+		windowLength = ef.burstWindow
+		if windowLength > 0 and len(timeStamps) != 0:
+			maxEvents = 0
+			maxEventsStart = 0
+			first = 0
+			for last in range(len(timeStamps)):
+				while timeStamps[last] - timeStamps[first] >= windowLength:
+					first = first + 1
+				if last - first + 1 > maxEvents:
+					maxEvents = last - first + 1
+					maxEventsStart = first
+			if maxEvents > ef.burstMaxEvents:
+				duration = timeStamps[-1] - timeStamps[0]
+				meanRate = len(timeStamps)*windowLength/duration if duration > 0 else len(timeStamps)
+				if check.error('EventBurst', "{} events within {} s starting at time stamp '{}', but at most {} events are allowed "
+				               "(mean {:.3g} events per {} s)"
+				               .format(maxEvents, windowLength, EPOCH + timedelta(seconds=timeStamps[maxEventsStart]), ef.burstMaxEvents,
+				                       meanRate, windowLength)):
+					return False
+		return True
+
+
+class CustomGroup(TestGroup):
+	"""Custom data, files are accepted as-is."""
+	name = 'IBK_Custom'
+	readLevel = READ_NONE
+	sizeCheck = SIZE_NONE
+	sampleCountCheck = False
+
+
+TEST_GROUPS = dict() # key = test group name, value = TestGroup object
+
+def registerTestGroup(group):
+	"""Registers a test group check pipeline, replaces an existing group with the same name."""
+	TEST_GROUPS[group.name] = group
+
+for group in [DHT22Group(), OneWireGroup(), WinStatGroup(), ConComGroup(), TimeSeriesGroup(), EventDataGroup(), CustomGroup()]:
+	registerTestGroup(group)
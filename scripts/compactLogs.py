@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Compacts the log files of a project: the entries of 'log/processed' and of the error log files
+'log/errors_<time stamp>' (one per run) are moved into the indexed log store 'log/store' (see
+LogStore.py) and the log files are removed. Use queryLogs.py to query the store.
+
+Error log files of recent runs (see --min-age) and the error log file referenced by 'log/errors'
+are kept, since they may still be written/read by MonVerifyTool.py. The file 'log/processed' is
+renamed before its entries are added, so that running MonVerifyTool.py instances start a new file.
+
+The script can be run while MonVerifyTool.py runs are active, for example daily by cron.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+from LogStore import LogStore
+
+# command line arguments
+parser = argparse.ArgumentParser(description="Compacts log files into the indexed log store.")
+parser.add_argument('projectDir', nargs='?', help='Root directory of the project.', default=os.getcwd())
+parser.add_argument('--min-age', dest='minAge', type=int, default=60, metavar='MIN',
+                    help='Min. age of error log files to be compacted, in minutes (default 60).')
+
+args = parser.parse_args()
+
+logDir = args.projectDir + "/log"
+if not os.path.exists(logDir):
+	print("Log directory '{}' does not exist.".format(logDir))
+	exit(1)
+
+store = LogStore(logDir + "/store")
+
+# processed log: renamed first, leftovers of interrupted compactions are processed as well
+processedCount = 0
+timeStamp = datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
+if os.path.exists(logDir + "/processed"):
+	os.rename(logDir + "/processed", logDir + "/processed." + timeStamp)
+for f in sorted(os.listdir(logDir)):
+	if f.startswith("processed."):
+		processedCount = processedCount + store.addProcessedLog(logDir + "/" + f, f)
+		os.remove(logDir + "/" + f)
+
+# error logs
+errorCount = 0
+errorFileCount = 0
+currentErrorLog = None
+if os.path.islink(logDir + "/errors"):
+	currentErrorLog = os.path.basename(os.readlink(logDir + "/errors"))
+minMTime = time.time() - args.minAge*60
+for f in sorted(os.listdir(logDir)):
+	if not f.startswith("errors_") or f == currentErrorLog:
+		continue
+	try:
+		ts = datetime.strptime(f[7:], '%Y-%m-%d_%H-%M-%S')
+	except ValueError:
+		continue # not an error log file
+	if os.path.getmtime(logDir + "/" + f) > minMTime:
+		continue # run may still be active
+	errorCount = errorCount + store.addErrorLog(logDir + "/" + f, f, ts.strftime('%Y-%m-%d %H:%M:%S'))
+	errorFileCount = errorFileCount + 1
+	os.remove(logDir + "/" + f)
+
+store.close()
+print("{} processed log entries and {} error log entries ({} files) compacted.".format(processedCount, errorCount, errorFileCount))
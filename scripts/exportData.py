@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Exports the data of one expected file prefix within a time range from the archive into a single
+data file (header of the first file, followed by the data lines of all days in the time range).
+
+Only the archived files of the days within the time range are read. For files in block-based
+gzip format only the blocks holding the time range are decompressed.
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from ArchiveReader import findArchivedFile, readHeader, readTimeRange
+
+
+def parseTimeStamp(tsString):
+	"""Parses time stamp given as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'."""
+	try:
+		return datetime.strptime(tsString, "%Y-%m-%d %H:%M:%S")
+	except ValueError:
+		return datetime.strptime(tsString, "%Y-%m-%d")
+
+
+# command line arguments
+parser = argparse.ArgumentParser(description="Exports data of a time range from the archive.")
+parser.add_argument('projectDir', help='Root directory of the project.')
+parser.add_argument('prefix', help="Expected file prefix, for example 'Fehlertests/Test_'.")
+parser.add_argument('start', help="Start of time range (inclusive), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.")
+parser.add_argument('end', help="End of time range (exclusive), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.")
+parser.add_argument('-o', '--output', dest='output', help='Output file (default: standard output).')
+
+args = parser.parse_args()
+
+try:
+	start = parseTimeStamp(args.start)
+	end = parseTimeStamp(args.end)
+except ValueError:
+	parser.error("Invalid time stamp format, expected 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'")
+startString = start.strftime("%Y-%m-%d %H:%M:%S")
+endString = end.strftime("%Y-%m-%d %H:%M:%S")
+
+archiveDir = args.projectDir + "/archive"
+
+out = sys.stdout
+if args.output != None:
+	out = open(args.output, 'w')
+
+headerWritten = False
+lineCount = 0
+day = datetime(start.year, start.month, start.day)
+while day < end:
+	archivedFile = findArchivedFile(archiveDir, args.prefix, day.strftime("%Y-%m-%d"))
+	day = day + timedelta(days=1)
+	if archivedFile == None:
+		sys.stderr.write("No archived file for day {}\n".format((day - timedelta(days=1)).strftime("%Y-%m-%d")))
+		continue
+	filePath, suffix = archivedFile
+	if not headerWritten:
+		for line in readHeader(filePath, suffix):
+			out.write(line + "\n")
+		out.write("\n")
+		headerWritten = True
+	for line in readTimeRange(filePath, suffix, startString, endString):
+		out.write(line + "\n")
+		lineCount = lineCount + 1
+
+if args.output != None:
+	out.close()
+	print("{} data lines written to '{}'.".format(lineCount, args.output))
+
+if not headerWritten:
+	exit(1)
@@ -12,18 +12,17 @@ import numpy as np
 import os
 import argparse
 
+from DirScan import scanFiles
+
 # command line arguments
 parser = argparse.ArgumentParser(description="Generates a histogramm of file sizes")
 parser.add_argument('projectDir', nargs='?', help='Directory to process.', default=os.getcwd())
 
 args = parser.parse_args()
 
-files = os.listdir(args.projectDir)
-
 fsizes = []
-for f in files:
+for f, fileSize, mtime in scanFiles(args.projectDir, recursive=False):
 	if len(f) > 3 and f[-3:] == 'csv':
-		fileSize = os.path.getsize(os.path.join(args.projectDir,f)) 
 		fsizes.append(fileSize)
 
 mi = min(fsizes)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Impact analysis of changes to the expectation (exp) file: the archived files of a project are checked
+again with the current exp file and with a candidate exp file (dry run, no files are moved and no logs
+are written), and the difference of passed/failed files is reported per prefix.
+
+Header reference and content test definition files referenced by the candidate exp file are looked up
+relative to the directory of the candidate file, so place the candidate file in (a copy of) the config
+directory.
+
+Files are checked in parallel worker processes (--workers), the checks of both exp files are run in
+the same worker. Uncompressed files up to SHARED_READ_MAX_SIZE are read from disk only once and the
+content is passed to both checks, compressed and larger files are read by each check.
+
+Syntax:
+
+    > impactAnalysis.py [options] <path/to/project> <path/to/candidate.exp>
+"""
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+from ChunkCheck import createPool
+from Compression import splitCompressionSuffix
+from ConfigFiles import ConfigFiles
+from DirScan import scanFiles
+import Logger
+from print_funcs import *
+
+# error categories of the file currently checked in a worker
+fileErrorCategories = []
+
+# max. size of files read into memory once for both checks, in bytes
+SHARED_READ_MAX_SIZE = 64*1024*1024
+
+
+def recordError(category, filepath, message):
+	"""Receives errors instead of the error log (see Logger.ERROR_HANDLER)."""
+	fileErrorCategories.append(category)
+
+
+def readConfig(expFilePath):
+	"""Reads an exp file, returns ConfigFiles object for checking archived files."""
+	config = ConfigFiles()
+	config.readExp(expFilePath)
+	config.archiveDir = archiveDir # continuity checks use the last sample of the previous archived file
+	return config
+
+
+def matchingExpectedFile(config, relPath):
+	"""Returns the expected file definition matching a file path, or None."""
+	for prefix in config.expectedFiles:
+		if relPath.find(prefix) == 0:
+			return config.expectedFiles[prefix]
+	return None
+
+
+def checkFile(config, relPath, fileSize, data=None):
+	"""Checks an archived file with the given config, data is the file content if already read into memory.
+
+	Returns tuple (True if passed, list of error categories).
+	"""
+	global fileErrorCategories
+	fileErrorCategories = []
+	ef = matchingExpectedFile(config, relPath)
+	if ef == None:
+		return (False, ['NotExpected'])
+	try:
+		passed = config.entryCheckPassedForFile(archiveDir, relPath, ef, True, fileSize, data)
+	except SystemExit:
+		passed = False # critical error, e.g. unreadable reference file
+		fileErrorCategories.append('Critical')
+	except Exception:
+		passed = False # unexpected error in the checks of this file, the analysis continues with the next file
+		fileErrorCategories.append('Exception')
+	return (passed, fileErrorCategories)
+
+
+def checkArchivedFile(task):
+	"""Checks an archived file with current and candidate config, executed in a worker process.
+
+	Returns tuple (path relative to archive dir, prefix, result with current config, result with candidate config).
+	"""
+	relPath, fileSize = task
+	ef = matchingExpectedFile(currentConfig, relPath) or matchingExpectedFile(candidateConfig, relPath)
+	prefix = ef.prefix if ef != None else os.path.dirname(relPath) + '/'
+	data = None
+	if splitCompressionSuffix(relPath)[1] == '' and fileSize <= SHARED_READ_MAX_SIZE:
+		try:
+			with open(archiveDir + '/' + relPath, 'rb') as f:
+				data = f.read()
+		except OSError:
+			pass # reported by the checks
+	return (relPath, prefix, checkFile(currentConfig, relPath, fileSize, data), checkFile(candidateConfig, relPath, fileSize, data))
+
+
+# command line arguments
+parser = argparse.ArgumentParser(description="Checks archived files with current and candidate exp file and reports the differences.")
+parser.add_argument('projectDir', help='Root directory of the project.')
+parser.add_argument('candidateExp', help='Candidate exp file.')
+parser.add_argument('--workers', dest='workers', type=int, default=os.cpu_count(), metavar='N',
+                    help='Number of parallel worker processes (default: number of CPUs).')
+parser.add_argument('--prefix', dest='prefix', help="Only check files of prefixes starting with this string, for example 'Fehlertests/'.")
+parser.add_argument('--from', dest='start', metavar='YYYY-MM-DD', help='Only check files of this day and later.')
+parser.add_argument('--to', dest='end', metavar='YYYY-MM-DD', help='Only check files of this day and earlier.')
+parser.add_argument('--list', dest='listFiles', action='store_true',
+                    help='List the files with changed results.')
+
+args = parser.parse_args()
+
+configDir = args.projectDir + "/config"
+archiveDir = args.projectDir + "/archive"
+expFiles = [f for f in os.listdir(configDir) if len(f) > 4 and f[-4:] == '.exp']
+if len(expFiles) != 1:
+	printError("Exactly one .exp file expected in config directory '{}'.".format(configDir))
+	exit(1)
+
+try:
+	currentConfig = readConfig(configDir + '/' + expFiles[0])
+	candidateConfig = readConfig(args.candidateExp)
+except (RuntimeError, IOError) as e:
+	printError(str(e))
+	exit(1)
+
+# dry run: no log files are written, errors are only recorded
+Logger.LOG_DIR = None
+Logger.ERROR_HANDLER = recordError
+
+tasks = []
+for relPath, fileSize, mtime in scanFiles(archiveDir):
+	if args.prefix != None and relPath.find(args.prefix) != 0:
+		continue
+	if relPath == 'missing.accepted':
+		continue
+	dayString = os.path.basename(relPath).split('_')
+	dayString = dayString[-2] if len(dayString) >= 3 else ''
+	if (args.start != None and dayString < args.start) or (args.end != None and dayString > args.end):
+		continue
+	tasks.append( (relPath, fileSize) )
+
+print("Checking {} archived files.".format(len(tasks)))
+sys.stdout.flush()
+
+# the checks print their messages, which are not needed here
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+pool = createPool(args.workers) if args.workers > 1 else None
+if pool != None:
+	results = list(pool.imap_unordered(checkArchivedFile, tasks, chunksize=16))
+	pool.close()
+	pool.join()
+else:
+	results = [checkArchivedFile(task) for task in tasks]
+sys.stdout.close()
+sys.stdout = stdout
+
+# summary per prefix
+prefixes = dict() # key = prefix, value = list of counts: files, passed (current), passed (candidate), newly failing, newly passing
+newFailureCategories = dict() # key = prefix, value = Counter of first error categories of newly failing files
+changedFiles = []
+for relPath, prefix, current, candidate in results:
+	counts = prefixes.setdefault(prefix, [0, 0, 0, 0, 0])
+	counts[0] = counts[0] + 1
+	if current[0]:
+		counts[1] = counts[1] + 1
+	if candidate[0]:
+		counts[2] = counts[2] + 1
+	if current[0] and not candidate[0]:
+		counts[3] = counts[3] + 1
+		category = candidate[1][0] if len(candidate[1]) != 0 else 'Unknown'
+		newFailureCategories.setdefault(prefix, Counter())[category] += 1
+		changedFiles.append( (relPath, "now fails ({})".format(category)) )
+	elif not current[0] and candidate[0]:
+		counts[4] = counts[4] + 1
+		changedFiles.append( (relPath, "now passes") )
+
+print("{:40s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}".format('Prefix', 'Files', 'Passed', 'Passed*', 'NewFail', 'NewPass'))
+for prefix in sorted(prefixes):
+	counts = prefixes[prefix]
+	print("{:40s} {:>8d} {:>8d} {:>8d} {:>8d} {:>8d}".format(prefix, *counts))
+	if prefix in newFailureCategories:
+		for category, count in newFailureCategories[prefix].most_common():
+			print("    {:36s} {:>8d}".format(category, count))
+print("(Passed = with current exp file, Passed* = with candidate exp file)")
+
+if args.listFiles:
+	for relPath, change in sorted(changedFiles):
+		print("{} : {}".format(relPath, change))
+
+# return code 1, if files would fail with the candidate exp file that pass with the current one
+if sum([prefixes[p][3] for p in prefixes]) != 0:
+	exit(1)
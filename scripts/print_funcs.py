@@ -8,22 +8,27 @@
 # License: BSD(2) License, see LICENSE file
 
 import config
-from colorama import *
+
+# Note: colorama is imported on first use only, since importing it takes a significant part
+#       of the start-up time of short runs that do not print any colored messages.
 
 def printError(msg):
 	if config.USE_COLORS:
+		from colorama import Fore, Style
 		print (Fore.RED + Style.BRIGHT + msg + Fore.RESET + Style.RESET_ALL)
 	else:
 		print (msg)
 
 def printWarning(msg):
 	if config.USE_COLORS:
+		from colorama import Fore, Style
 		print (Fore.YELLOW + Style.BRIGHT + msg + Fore.RESET + Style.RESET_ALL)
 	else:
 		print (msg)
 
 def printNotification(msg):
 	if config.USE_COLORS:
+		from colorama import Fore, Style
 		print (Fore.GREEN + Style.BRIGHT + msg + Fore.RESET + Style.RESET_ALL)
 	else:
 		print (msg)
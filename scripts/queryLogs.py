@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Developed at IBK, TU Dresden, Germany
+#
+# Authors: Andreas Nicolai <andreas.nicolai -at- tu-dresden[dot]de>
+#
+# License: BSD(2) License, see LICENSE file
+
+"""
+Queries the log store 'log/store' of a project (see compactLogs.py) for processed files and
+errors, filtered by file prefix, category and time range.
+
+Example: when did prefix 'Fehlertests/Test_' last fail?
+
+    > queryLogs.py /path/to/project --errors --prefix Fehlertests/Test_ --last 1
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+from LogStore import LogStore
+
+
+def parseTimeStamp(tsString):
+	"""Parses time stamp given as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'."""
+	try:
+		return datetime.strptime(tsString, "%Y-%m-%d %H:%M:%S")
+	except ValueError:
+		return datetime.strptime(tsString, "%Y-%m-%d")
+
+
+# command line arguments
+parser = argparse.ArgumentParser(description="Queries the log store of a project.")
+parser.add_argument('projectDir', nargs='?', help='Root directory of the project.', default=os.getcwd())
+parser.add_argument('--errors', dest='table', action='store_const', const='errors', default='processed',
+                    help='Query error log entries (default: processed log entries).')
+parser.add_argument('--prefix', dest='prefix', help="File prefix, for example 'Fehlertests/Test_' (may contain wildcards * and ?).")
+parser.add_argument('--category', dest='category', help="Category, for example 'Archiving' or 'InvalidHeader'.")
+parser.add_argument('--from', dest='start', help="Start of time range (inclusive), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.")
+parser.add_argument('--to', dest='end', help="End of time range (exclusive), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.")
+parser.add_argument('--last', dest='last', type=int, default=0, metavar='N',
+                    help='Show only the N newest entries (newest first).')
+
+args = parser.parse_args()
+
+try:
+	start = parseTimeStamp(args.start).strftime("%Y-%m-%d %H:%M:%S") if args.start != None else None
+	end = parseTimeStamp(args.end).strftime("%Y-%m-%d %H:%M:%S") if args.end != None else None
+except ValueError:
+	parser.error("Invalid time stamp format, expected 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'")
+
+store = LogStore(args.projectDir + "/log/store")
+count = 0
+for ts, category, path, message in store.query(args.table, args.prefix, args.category, start, end,
+                                                newestFirst=args.last > 0, limit=args.last):
+	if message != None:
+		print("{}\t{}\t{}\t{}".format(ts, category, path, message))
+	else:
+		print("{}\t{}\t{}".format(ts, category, path))
+	count = count + 1
+store.close()
+
+if count == 0:
+	exit(1)